@@ -0,0 +1,253 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import platform
+import subprocess
+
+import PIL
+import pygments
+from PIL import Image
+
+import encoders
+import project
+import renderer
+
+# Corpus dimensions swept by default
+DEFAULT_LINES = (10, 100, 1000)
+DEFAULT_WIDTHS = (40, 120)
+DEFAULT_REPEAT = 3
+
+# A stage regresses when it gets this much slower than the baseline...
+DEFAULT_THRESHOLD = 0.25
+# ...and by at least this many seconds, so timer noise on tiny stages is ignored
+MIN_REGRESSION_SECONDS = 0.002
+
+# Stages of an export, in pipeline order
+STAGES = ("lex", "layout", "rasterize", "window", "shadow", "composite", "encode")
+
+# Comment syntax and a few representative statements per language, used to
+# generate code that exercises each lexer's common paths
+LINE_COMMENTS = {
+    "python": "#", "bash": "#", "ruby": "#", "r": "#", "powershell": "#",
+    "matlab": "%", "sql": "--",
+}
+STATEMENTS = {
+    "python": ["{name} = compute({num}, \"{text}\")", "def {name}(value):", "    return value * {num}",
+               "for item in range({num}):", "if {name} is not None:"],
+    "matlab": ["{name} = zeros({num}, 1);", "function out = {name}(x)", "disp('{text}');", "end"],
+    "bash": ["{name}={num}", "echo \"{text} ${name}\"", "for i in $(seq 1 {num}); do", "done"],
+    "java": ["int {name} = {num};", "public void {name}() {{", "System.out.println(\"{text}\");", "}}"],
+    "javascript": ["const {name} = {num};", "function {name}(x) {{", "console.log(`{text}`);", "}}"],
+    "html": ["<div class=\"{name}\">{text}</div>", "<p id=\"p{num}\">{text}</p>", "<br/>"],
+    "css": [".{name} {{ margin: {num}px; }}", "#{name} {{ color: #{num:06x}; }}"],
+    "c": ["int {name} = {num};", "printf(\"{text}\\n\");", "for (int i = 0; i < {num}; i++) {{", "}}"],
+    "cpp": ["auto {name} = std::vector<int>({num});", "std::cout << \"{text}\" << std::endl;", "}}"],
+    "csharp": ["var {name} = {num};", "Console.WriteLine(\"{text}\");", "public int {name}() {{", "}}"],
+    "php": ["<?php ${name} = {num}; ?>", "<?php echo \"{text}\"; ?>"],
+    "ruby": ["{name} = {num}", "puts \"{text}\"", "def {name}(x)", "end"],
+    "swift": ["let {name} = {num}", "print(\"{text}\")", "func {name}() -> Int {{", "}}"],
+    "kotlin": ["val {name} = {num}", "println(\"{text}\")", "fun {name}(): Int {{", "}}"],
+    "go": ["{name} := {num}", "fmt.Println(\"{text}\")", "func {name}() int {{", "}}"],
+    "rust": ["let {name} = {num};", "println!(\"{text}\");", "fn {name}() -> i32 {{", "}}"],
+    "r": ["{name} <- c({num}, 2)", "print(\"{text}\")", "{name} <- function(x) x * {num}"],
+    "sql": ["SELECT {name} FROM t{num} WHERE id = {num};", "INSERT INTO {name} VALUES ('{text}');"],
+    "powershell": ["${name} = {num}", "Write-Host \"{text}\"", "function {name} {{", "}}"],
+}
+WORDS = ["alpha", "beta", "gamma", "delta", "render", "value", "index", "buffer", "total", "result"]
+
+
+def generate_code(language, lines, width, seed=0):
+    """Deterministic synthetic ``language`` source of ``lines`` lines, padded to about ``width`` columns"""
+    rng = random.Random(f"{language}:{lines}:{width}:{seed}")
+    templates = STATEMENTS.get(language, STATEMENTS["python"])
+    comment = LINE_COMMENTS.get(language, "//")
+    if language in ("html", "css"):
+        comment = None  # No line comments; pad with longer text instead
+
+    out = []
+    for _ in range(lines):
+        line = rng.choice(templates).format(
+            name=rng.choice(WORDS) + str(rng.randrange(100)),
+            num=rng.randrange(1, 5000),
+            text=" ".join(rng.choice(WORDS) for _ in range(3)),
+        )
+        padding = width - len(line)
+        if padding > 4:
+            filler = " ".join(rng.choice(WORDS) for _ in range(padding // 5 + 1))
+            if comment:
+                line = f"{line}  {comment} {filler}"[:width]
+            else:
+                line = f"{line} {filler}"[:width]
+        out.append(line)
+    return "\n".join(out)
+
+
+def time_stages(code, language, title="benchmark", include_circles=False, formatter_options=None, output=None):
+    """
+    Run one export through every stage of the pipeline, timing each.
+    Returns ``({stage: seconds}, image size, encoded bytes)``.
+    """
+    output = encoders.output_settings(output)
+    times = {}
+    clock = time.perf_counter
+
+    start = clock()
+    tokens = list(renderer.get_lexer(language).get_tokens(code))
+    times["lex"] = clock() - start
+
+    formatter = renderer.get_formatter(renderer.formatter_key(formatter_options))
+    with renderer._formatter_lock:
+        start = clock()
+        code_size = formatter.layout(tokens)
+        times["layout"] = clock() - start
+
+        start = clock()
+        img = Image.new('RGB', code_size, formatter.background_color)
+        formatter.paint(img)
+        times["rasterize"] = clock() - start
+
+    start = clock()
+    window = renderer.window_image(img, title, include_circles)
+    times["window"] = clock() - start
+
+    start = clock()
+    final_image = renderer.drop_shadow(*window.size)
+    times["shadow"] = clock() - start
+
+    start = clock()
+    final_image.paste(window, (renderer.SHADOW_OFFSET, renderer.SHADOW_OFFSET), window)
+    times["composite"] = clock() - start
+
+    buffer = io.BytesIO()
+    start = clock()
+    if output["format"] == "svg":
+        buffer.write(renderer.svg_image(formatter, tokens, code_size, title, include_circles).encode("utf-8"))
+    else:
+        encoders.save_image(final_image, buffer, output)
+    times["encode"] = clock() - start
+
+    return times, final_image.size, buffer.tell()
+
+
+# Imports the GUI module in a fresh interpreter and prints how long it took
+STARTUP_SCRIPT = "import time; start = time.perf_counter(); import codecanvas; print(time.perf_counter() - start)"
+
+
+def measure_startup(repeat=DEFAULT_REPEAT):
+    """
+    Fastest of ``repeat`` cold imports of the GUI module, in seconds: the part
+    of startup before the window can be built. None if it can't be imported
+    (e.g. no tkinter).
+    """
+    best = None
+    for _ in range(repeat):
+        try:
+            out = subprocess.run(
+                [sys.executable, "-c", STARTUP_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                capture_output=True, text=True, check=True,
+            ).stdout
+            seconds = float(out.strip().splitlines()[-1])
+        except (subprocess.CalledProcessError, ValueError, IndexError):
+            return None
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def case_id(language, lines, width):
+    return f"{language}-{lines}x{width}"
+
+
+def run(languages=None, line_counts=DEFAULT_LINES, widths=DEFAULT_WIDTHS, repeat=DEFAULT_REPEAT,
+        output=None, log=None):
+    """
+    Time every stage over the generated corpora. Each stage reports its
+    fastest time of ``repeat`` runs. Returns the results as a JSON-ready dict.
+    """
+    languages = languages or project.LANGUAGES
+    renderer.warm_up(languages)
+
+    cases = {}
+    for language in languages:
+        for lines in line_counts:
+            for width in widths:
+                code = generate_code(language, lines, width)
+                # Untimed first run, so one-off costs like font loading don't count
+                time_stages(code, language, output=output)
+                best = {}
+                for _ in range(repeat):
+                    times, size, size_bytes = time_stages(code, language, output=output)
+                    for stage, seconds in times.items():
+                        best[stage] = min(seconds, best.get(stage, seconds))
+                cases[case_id(language, lines, width)] = {
+                    "language": language,
+                    "lines": lines,
+                    "width": width,
+                    "image_size": list(size),
+                    "bytes": size_bytes,
+                    "stages": best,
+                }
+                if log:
+                    log(f"{case_id(language, lines, width)}: {sum(best.values()) * 1000:.1f} ms")
+
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pillow": PIL.__version__,
+            "pygments": pygments.__version__,
+            "render_version": renderer.RENDER_VERSION,
+            "output": encoders.output_settings(output),
+            "repeat": repeat,
+        },
+        "startup": {"import": measure_startup(repeat)},
+        "cases": cases,
+        "totals": stage_totals(cases),
+    }
+
+
+def stage_totals(cases, case_ids=None):
+    """Seconds per stage summed over ``case_ids`` (default: all cases)"""
+    totals = dict.fromkeys(STAGES, 0.0)
+    for key in case_ids if case_ids is not None else cases:
+        for stage, seconds in cases[key]["stages"].items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+    return totals
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare per-stage totals over the cases both runs have. Returns a list of
+    ``(stage, baseline seconds, current seconds)`` for every stage that got
+    slower than the baseline by more than ``threshold`` (a fraction).
+    """
+    shared = [key for key in results["cases"] if key in baseline["cases"]]
+    current = stage_totals(results["cases"], shared)
+    before = stage_totals(baseline["cases"], shared)
+    regressions = []
+    for stage, seconds in results.get("startup", {}).items():
+        # Reported like a stage, e.g. "startup.import"
+        previous = baseline.get("startup", {}).get(stage)
+        if seconds is not None and previous is not None:
+            current[f"startup.{stage}"] = seconds
+            before[f"startup.{stage}"] = previous
+    for stage in current:
+        if stage not in before:
+            continue
+        slower = current[stage] - before[stage]
+        if slower > before[stage] * threshold and slower > MIN_REGRESSION_SECONDS:
+            regressions.append((stage, before[stage], current[stage]))
+    return regressions
+
+
+def save_results(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=4)
+
+
+def load_results(path):
+    with open(path, "r") as f:
+        return json.load(f)
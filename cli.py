@@ -0,0 +1,293 @@
+import os
+import sys
+import time
+import argparse
+
+import encoders
+import project
+
+
+def render_project(project_dir, output_dir=None, include_circles=False, workers=None, use_cache=True,
+                   max_lines=None, max_height=None, output=None, trace=None, scales=None):
+    """
+    Render every cell of ``project_dir`` into its images folder; returns (saved, errors).
+    ``output`` encoder settings override the ones saved in the project. With
+    ``trace``, per-cell timings are written to that JSON file. ``scales``
+    (e.g. ``[1, 2]``) saves each image once per scale factor. Cells linked to
+    a source file are rendered from its current contents.
+    """
+    import exporter
+    import render_cache
+    import watch
+
+    output_dir = output_dir or project.images_folder(project_dir)
+    cells, settings = project.load_project(project_dir)
+    _, source_errors = watch.sync_cells(project_dir, cells)
+    settings.update((key, value) for key, value in (output or {}).items() if value is not None)
+    cache = render_cache.RenderCache(project_dir) if use_cache else None
+    options = {"max_lines": max_lines, "max_height": max_height, "output": settings, "scales": scales}
+    saved = []
+    errors = []
+    stats = {} if trace else None
+    start = time.perf_counter()
+    results = exporter.export_cells(cells, output_dir, workers, include_circles, cache,
+                                    options=options, stats=stats)
+    if trace:
+        exporter.write_trace(trace, stats, folder=output_dir, workers=workers or exporter.default_workers(),
+                             wall=time.perf_counter() - start)
+    for index, image_paths, error in results:
+        if error:
+            errors.append((index, cells[index].title, error))
+        else:
+            saved.extend(image_paths)
+    for index, error in source_errors.items():
+        # Rendered from the last code saved in the project, but report the broken link
+        errors.append((index, cells[index].title, error))
+    return saved, errors
+
+
+def cmd_render(args):
+    if not os.path.isfile(project.project_file(args.project_dir)):
+        print(f"No {project.PROJECT_FILE} found in {args.project_dir}", file=sys.stderr)
+        return 2
+
+    output = {
+        "format": args.format,
+        "compress_level": args.compress_level,
+        "optimize": args.optimize or None,
+        "colors": args.colors,
+    }
+    try:
+        saved, errors = render_project(
+            args.project_dir, args.output, args.circles, args.workers, not args.no_cache,
+            args.max_lines, args.max_height, output, args.trace, args.scales,
+        )
+    except ValueError as e:
+        # Invalid output or scale settings
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    for image_path in saved:
+        print(f"Saved: {image_path}")
+    for index, title, error in errors:
+        print(f"Error exporting cell {index} ({title or 'untitled'}): {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def cmd_bench(args):
+    import benchmark
+
+    results = benchmark.run(
+        args.languages, args.lines, args.widths, args.repeat, {"format": args.format},
+        log=lambda message: print(message, file=sys.stderr),
+    )
+    benchmark.save_results(results, args.output)
+    for stage, seconds in results["totals"].items():
+        print(f"{stage:>10}: {seconds * 1000:9.1f} ms")
+    if results["startup"]["import"] is not None:
+        print(f"{'startup':>10}: {results['startup']['import'] * 1000:9.1f} ms (importing the GUI)")
+    print(f"Saved results to {args.output}")
+
+    if not args.baseline:
+        return 0
+    baseline = benchmark.load_results(args.baseline)
+    regressions = benchmark.compare(results, baseline, args.threshold)
+    for stage, before, after in regressions:
+        print(f"Regression in {stage}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms "
+              f"(+{(after / before - 1) * 100:.0f}%)", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def cmd_serve(args):
+    import server
+
+    server.serve(
+        args.host, args.port, args.socket, args.workers,
+        args.batch_window / 1000, args.cache_mb * 1024 * 1024, args.verbose,
+    )
+    return 0
+
+
+def cmd_watch(args):
+    import watch
+
+    if not os.path.isfile(project.project_file(args.project_dir)):
+        print(f"No {project.PROJECT_FILE} found in {args.project_dir}", file=sys.stderr)
+        return 2
+    watch.watch(args.project_dir, args.output, args.circles, args.workers, args.interval, args.debounce)
+    return 0
+
+
+def cmd_sheet(args):
+    import re
+    import search
+    import sheet
+    import watch
+
+    if not os.path.isfile(project.project_file(args.project_dir)):
+        print(f"No {project.PROJECT_FILE} found in {args.project_dir}", file=sys.stderr)
+        return 2
+    cells, _ = project.load_project(args.project_dir)
+    _, source_errors = watch.sync_cells(args.project_dir, cells)
+    for index, error in source_errors.items():
+        print(f"Error reading cell {index} ({cells[index].title or 'untitled'}): {error}", file=sys.stderr)
+
+    indexes = list(range(len(cells)))
+    if args.cells:
+        indexes = [number - 1 for number in args.cells if 1 <= number <= len(cells)]
+    if args.match:
+        try:
+            matches = set(search.SearchIndex(cells).search(cells, args.match, args.regex))
+        except re.error as e:
+            print(f"Invalid regex: {e}", file=sys.stderr)
+            return 2
+        indexes = [index for index in indexes if index in matches]
+
+    try:
+        pages, errors = sheet.export_sheet(
+            [cells[index] for index in indexes], args.output, args.circles,
+            width=args.width, page_height=args.page_height, scale=args.scale,
+        )
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    for position, error in errors:
+        index = indexes[position]
+        print(f"Error exporting cell {index} ({cells[index].title or 'untitled'}): {error}", file=sys.stderr)
+    cell_count = len(indexes) - len(errors)
+    print(f"Saved: {args.output} ({cell_count} cell{'s' if cell_count != 1 else ''}, "
+          f"{pages} page{'s' if pages != 1 else ''})")
+    return 1 if errors else 0
+
+
+def int_list(value):
+    return [int(part) for part in value.split(",") if part]
+
+
+def cell_list(value):
+    """1-based cell numbers and ranges, e.g. ``1,4-6``"""
+    numbers = []
+    try:
+        for part in value.split(","):
+            if "-" in part:
+                first, last = part.split("-")
+                numbers.extend(range(int(first), int(last) + 1))
+            elif part:
+                numbers.append(int(part))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid cell list: '{value}'")
+    return numbers
+
+
+def positive_int(value):
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+    return number
+
+
+def scale_list(value):
+    import renderer
+
+    try:
+        return renderer.scale_factors([part for part in value.split(",") if part])
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="codecanvas", description="Create code snippet images.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    render = subparsers.add_parser("render", help="render a project's cells to images without the GUI")
+    render.add_argument("project_dir", help="project folder containing file.imgnb")
+    render.add_argument("-o", "--output", help="output folder (default: <project_dir>/images)")
+    render.add_argument("--circles", action="store_true", help="draw macOS-style window controls")
+    render.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of render processes (default: one per CPU core)")
+    render.add_argument("--no-cache", action="store_true",
+                        help="re-render every cell instead of skipping unchanged ones")
+    render.add_argument("--max-lines", type=positive_int, default=None,
+                        help="split snippets longer than this into numbered pages")
+    render.add_argument("--max-height", type=positive_int, default=None,
+                        help="split snippets into pages at most this many pixels tall")
+    render.add_argument("--trace", help="write per-cell stage timings to this JSON file")
+    render.add_argument("--scales", type=scale_list, default=None,
+                        help="comma separated scale factors to save, e.g. 1,2,3 for 1x, @2x and @3x images")
+    render.add_argument("--format", choices=list(encoders.FORMATS), default=None,
+                        help="output format (default: the project's setting, or png)")
+    render.add_argument("--compress-level", type=int, default=None,
+                        help="PNG zlib compression level, 0-9 (default: 6)")
+    render.add_argument("--optimize", action="store_true",
+                        help="spend more time to make PNGs smaller")
+    render.add_argument("--colors", type=int, default=None,
+                        help="palette size for png-palette, 2-256 (default: 256)")
+    render.set_defaults(func=cmd_render)
+
+    bench = subparsers.add_parser("bench", help="time each stage of the render pipeline on generated code")
+    bench.add_argument("-o", "--output", default="benchmark.json", help="where to write the results (JSON)")
+    bench.add_argument("--baseline", help="results file to compare against; exits with 1 on a regression")
+    bench.add_argument("--threshold", type=float, default=0.25,
+                       help="fraction a stage may slow down before it counts as a regression (default: 0.25)")
+    bench.add_argument("--languages", nargs="+", choices=project.LANGUAGES, default=None,
+                       help="languages to generate code in (default: all)")
+    bench.add_argument("--lines", type=int_list, default=[10, 100, 1000],
+                       help="comma separated line counts (default: 10,100,1000)")
+    bench.add_argument("--widths", type=int_list, default=[40, 120],
+                       help="comma separated line widths in characters (default: 40,120)")
+    bench.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest counts (default: 3)")
+    bench.add_argument("--format", choices=list(encoders.FORMATS), default="png", help="output format to encode")
+    bench.set_defaults(func=cmd_bench)
+
+    serve = subparsers.add_parser("serve", help="render snippets on request over local HTTP")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    serve.add_argument("--socket", help="listen on this Unix socket instead of a TCP port")
+    serve.add_argument("-j", "--workers", type=int, default=None,
+                       help="number of render processes (default: one per CPU core)")
+    serve.add_argument("--batch-window", type=float, default=5,
+                       help="milliseconds to wait for concurrent requests to batch together (default: 5)")
+    serve.add_argument("--cache-mb", type=int, default=64,
+                       help="memory for recently rendered images, in MB (default: 64)")
+    serve.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    serve.set_defaults(func=cmd_serve)
+
+    watch = subparsers.add_parser("watch", help="re-render cells linked to source files whenever the files change")
+    watch.add_argument("project_dir", help="project folder containing file.imgnb")
+    watch.add_argument("-o", "--output", help="output folder (default: <project_dir>/images)")
+    watch.add_argument("--circles", action="store_true", help="draw macOS-style window controls")
+    watch.add_argument("-j", "--workers", type=int, default=None,
+                       help="number of render processes (default: one per CPU core)")
+    watch.add_argument("--interval", type=float, default=0.5,
+                       help="seconds between checks for changed files (default: 0.5)")
+    watch.add_argument("--debounce", type=float, default=0.3,
+                       help="seconds files must stay unchanged before re-rendering (default: 0.3)")
+    watch.set_defaults(func=cmd_watch)
+
+    sheet = subparsers.add_parser("sheet", help="lay out a project's cells on one contact sheet (PNG) or PDF")
+    sheet.add_argument("project_dir", help="project folder containing file.imgnb")
+    sheet.add_argument("output", help="file to write; .png for one tall sheet, .pdf for pages")
+    sheet.add_argument("--cells", type=cell_list, default=None,
+                       help="comma separated cell numbers or ranges to include, e.g. 1,4-6 (default: all)")
+    sheet.add_argument("--match", help="only include cells whose title or code contain this text")
+    sheet.add_argument("--regex", action="store_true", help="treat --match as a regular expression")
+    sheet.add_argument("--circles", action="store_true", help="draw macOS-style window controls")
+    sheet.add_argument("--width", type=positive_int, default=2400,
+                       help="width to fill with snippets, in pixels at 1x (default: 2400)")
+    sheet.add_argument("--page-height", type=positive_int, default=3200,
+                       help="PDF page height in pixels at 1x; longer snippets are split (default: 3200)")
+    sheet.add_argument("--scale", type=lambda value: scale_list(value)[0], default=1,
+                       help="scale factor, e.g. 2 for a high-DPI sheet (default: 1)")
+    sheet.set_defaults(func=cmd_sheet)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not getattr(args, "func", None):
+        return None
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main() or 0)
@@ -1,15 +1,38 @@
+import time
+STARTED = time.perf_counter()  # For the startup time measurement
+
 import os
+import re
 import json
+import importlib
 import tkinter as tk
 from tkinter import filedialog, ttk, scrolledtext, font
 from tkinter import messagebox
-from pygments import lexers, formatters, highlight
-from pygments.lexers import get_lexer_by_name
-import pyperclip
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
-import io
-from pygments.formatters import HtmlFormatter, ImageFormatter
 import subprocess
+import sys
+import queue
+import threading
+import traceback
+
+# Only modules that are cheap to import are loaded up front; the render,
+# highlighting and clipboard stacks are imported where they are first used
+# and warmed up in the background once the window is showing
+import encoders
+import project
+import search
+
+AUTOSAVE_MS = 3000  # How often edited cells are journaled
+SEARCH_DELAY_MS = 150  # Pause in typing before the search runs
+SEARCH_INDEX_BATCH = 50  # Cells indexed per idle step after a project opens
+
+# Loaded by warm_up() after the first frame
+WARM_UP_MODULES = ("pyperclip", "highlighter", "render_cache", "exporter")
+
+# Set to print the time to the first frame and to a warm render stack
+STARTUP_TIME_ENV = "CODECANVAS_STARTUP_TIME"
+
+# Scale factors offered for "Download All"; each saves 1x plus high-DPI copies
+SCALE_CHOICES = ("1x", "1x, 2x", "1x, 2x, 3x")
 
 class CodeEditorApp:
     def __init__(self, root):
@@ -24,6 +47,19 @@ class CodeEditorApp:
         
         self.project_path = None
         self.cells = []
+        self.settings = {}  # project-wide export settings, see encoders.DEFAULT_SETTINGS
+        
+        # Autosave: edited cells are appended to a journal every few seconds
+        self.journal = None
+        self.dirty_cells = {}  # id(cell) -> cell edited since the last autosave
+        
+        # Search over cell titles and code
+        self.search_index = search.SearchIndex()
+        self.search_results = []  # indexes of the matching cells
+        self.search_position = -1
+        self.search_key = None    # (query, regex) the results are for
+        self.search_pending = None
+        self.index_pending = None
         
         # Create a main frame with padding
         self.main_frame = ttk.Frame(root, padding="10")
@@ -52,52 +88,153 @@ class CodeEditorApp:
         self.open_folder_button = ttk.Button(self.toolbar, text="Open Folder", command=self.open_folder, width=15)
         self.open_folder_button.pack(side=tk.LEFT, padx=5, pady=5)
         
-        # Create a canvas with scrollbar for the cells
-        self.canvas_frame = ttk.Frame(self.main_frame)
-        self.canvas_frame.pack(fill=tk.BOTH, expand=True)
+        self.stats_button = ttk.Button(self.toolbar, text="Export Stats", command=self.show_stats, width=15)
+        self.stats_button.pack(side=tk.LEFT, padx=5, pady=5)
         
-        self.canvas = tk.Canvas(self.canvas_frame)
-        self.scrollbar = ttk.Scrollbar(self.canvas_frame, orient="vertical", command=self.canvas.yview)
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.sheet_button = ttk.Button(self.toolbar, text="Export Sheet", command=self.export_sheet, width=15)
+        self.sheet_button.pack(side=tk.LEFT, padx=5, pady=5)
         
-        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        # Number of processes used by "Download All"
+        default_workers = os.cpu_count() or 1  # Same default as exporter.default_workers()
+        self.workers_var = tk.IntVar(value=default_workers)
+        self.workers_spinbox = ttk.Spinbox(
+            self.toolbar, 
+            from_=1, 
+            to=default_workers * 2, 
+            textvariable=self.workers_var, 
+            width=4
+        )
+        self.workers_spinbox.pack(side=tk.RIGHT, padx=5, pady=5)
+        ttk.Label(self.toolbar, text="Workers:").pack(side=tk.RIGHT)
         
-        # Frame inside canvas for cells
-        self.cell_frame = ttk.Frame(self.canvas)
-        self.canvas_window = self.canvas.create_window((0, 0), window=self.cell_frame, anchor="nw")
+        # Split longer snippets into numbered pages (0 = never)
+        self.max_lines_var = tk.IntVar(value=0)
+        self.max_lines_spinbox = ttk.Spinbox(
+            self.toolbar, 
+            from_=0, 
+            to=100000, 
+            increment=50, 
+            textvariable=self.max_lines_var, 
+            width=6
+        )
+        self.max_lines_spinbox.pack(side=tk.RIGHT, padx=5, pady=5)
+        ttk.Label(self.toolbar, text="Lines per page:").pack(side=tk.RIGHT)
         
-        # Configure canvas to resize with window
-        self.cell_frame.bind("<Configure>", self.on_frame_configure)
-        self.canvas.bind("<Configure>", self.on_canvas_configure)
+        # Extra high-DPI copies of every image (@2x, @3x)
+        self.scales_var = tk.StringVar(value=SCALE_CHOICES[0])
+        self.scales_dropdown = ttk.Combobox(
+            self.toolbar, 
+            textvariable=self.scales_var, 
+            values=SCALE_CHOICES, 
+            state="readonly", 
+            width=10
+        )
+        self.scales_dropdown.pack(side=tk.RIGHT, padx=5, pady=5)
+        ttk.Label(self.toolbar, text="Scales:").pack(side=tk.RIGHT)
+        
+        # Output format, saved with the project
+        self.format_var = tk.StringVar(value=encoders.DEFAULT_SETTINGS["format"])
+        self.format_dropdown = ttk.Combobox(
+            self.toolbar, 
+            textvariable=self.format_var, 
+            values=list(encoders.FORMATS), 
+            state="readonly", 
+            width=12
+        )
+        self.format_dropdown.pack(side=tk.RIGHT, padx=5, pady=5)
+        self.format_dropdown.bind("<<ComboboxSelected>>", self.on_format_change)
+        ttk.Label(self.toolbar, text="Format:").pack(side=tk.RIGHT)
+        
+        # Search bar: Enter jumps to the next matching cell, Shift+Enter to the previous one
+        self.search_bar = ttk.Frame(self.main_frame)
+        self.search_bar.pack(fill=tk.X, pady=(0, 10))
+        
+        ttk.Label(self.search_bar, text="Search:").pack(side=tk.LEFT, padx=(0, 5))
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(self.search_bar, textvariable=self.search_var, width=40)
+        self.search_entry.pack(side=tk.LEFT, padx=(0, 5), fill=tk.X, expand=True)
+        self.search_entry.bind("<KeyRelease>", self.on_search_key)
+        self.search_entry.bind("<Return>", lambda event: self.next_match(1))
+        self.search_entry.bind("<Shift-Return>", lambda event: self.next_match(-1))
+        self.search_entry.bind("<Escape>", self.clear_search)
+        
+        self.regex_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.search_bar, text="Regex", variable=self.regex_var, command=self.run_search).pack(
+            side=tk.LEFT, padx=5
+        )
+        ttk.Button(self.search_bar, text="Previous", command=lambda: self.next_match(-1), width=10).pack(
+            side=tk.LEFT, padx=5
+        )
+        ttk.Button(self.search_bar, text="Next", command=lambda: self.next_match(1), width=10).pack(
+            side=tk.LEFT, padx=5
+        )
+        self.search_status = tk.StringVar()
+        ttk.Label(self.search_bar, textvariable=self.search_status, width=16).pack(side=tk.LEFT, padx=5)
+        
+        # Create a scrolling list for the cells; only the visible ones get widgets
+        self.canvas_frame = ttk.Frame(self.main_frame)
+        self.canvas_frame.pack(fill=tk.BOTH, expand=True)
+        
+        self.cell_list = VirtualCellList(self.canvas_frame, self)
+        self.canvas = self.cell_list.canvas
         
         # Mouse wheel scrolling for the main window
         # We'll handle mouse wheel events differently based on where the cursor is
         self.canvas.bind_all("<MouseWheel>", self.on_mousewheel)
         
-        # Status bar for messages
+        # Status bar for messages, with export progress and a cancel button on the right
+        self.status_frame = ttk.Frame(root)
+        self.status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        
         self.status_var = tk.StringVar()
-        self.status_bar = ttk.Label(root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
-        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_bar = ttk.Label(self.status_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
+        self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
         self.status_var.set("Ready")
         
+        # Only shown while an export is running
+        self.export_progress = ttk.Progressbar(self.status_frame, length=200, mode="determinate")
+        self.cancel_export_button = ttk.Button(self.status_frame, text="Cancel", command=self.cancel_export, width=10)
+        
+        # Background export state
+        self.export_thread = None
+        self.export_queue = None
+        self.export_cancel = None
+        self.export_data = []
+        self.export_folder = None
+        self.export_cache = None
+        self.export_done = 0
+        self.export_total = 0
+        self.export_single = False
+        self.export_workers = 0
+        self.export_started = 0.0
+        
+        # Per-cell timings of the last export, shown in the stats panel
+        self.export_stats = {}
+        self.export_wall = 0.0
+        
+        # Contact sheet export, also on a worker thread
+        self.sheet_thread = None
+        self.sheet_queue = None
+        self.sheet_path = None
+        self.sheet_cells = []
+        self.stats_panel = None
+        
         # Default language options
-        self.available_languages = [
-            "python", "matlab", "bash", "java", "javascript", "html", 
-            "css", "c", "cpp", "csharp", "php", "ruby", "swift", 
-            "kotlin", "go", "rust", "r", "sql",  "powershell"
-        ]
+        self.available_languages = list(project.LANGUAGES)
         
         # Track which widget has focus for scrolling behavior
         self.focused_text = None
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(AUTOSAVE_MS, self.autosave_tick)
+        
+        # Idle callbacks run in order, so this one runs after the first frame is drawn
+        self.startup_time = None
+        self.root.after_idle(self.on_first_frame)
 
-    def on_frame_configure(self, event):
-        # Update the scrollregion to encompass the inner frame
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-
-    def on_canvas_configure(self, event):
-        # Update the width of the window to fit the canvas
-        self.canvas.itemconfig(self.canvas_window, width=event.width)
+    def on_first_frame(self):
+        self.startup_time = time.perf_counter() - STARTED
+        threading.Thread(target=warm_up, daemon=True).start()
 
     def on_mousewheel(self, event):
         # Check if a text widget has focus
@@ -115,16 +252,21 @@ class CodeEditorApp:
     def create_project(self):
         project_dir = filedialog.askdirectory(title="Select Directory for New Project")
         if project_dir:
+            self.autosave()  # Don't lose pending edits of the previous project
             self.project_path = project_dir
             file_path = os.path.join(self.project_path, "file.imgnb")
             if not os.path.exists(file_path):
-                with open(file_path, "w") as f:
-                    json.dump({"cells": []}, f)
+                project.save_cells(project_dir, [])
+                self.journal = project.ProjectJournal(project_dir)
+            else:
+                # Journaled edits would be replayed on top of the existing
+                # project, so autosave starts once it is explicitly saved over
+                self.journal = None
+            self.dirty_cells.clear()
+            self.set_settings({})
             
             # Clear existing cells
-            for cell in self.cells:
-                cell.frame.destroy()
-            self.cells.clear()
+            self.set_cells([])
             
             self.status_var.set(f"Created new project in {project_dir}")
             self.root.title(f"Code Editor - {os.path.basename(project_dir)}")
@@ -133,80 +275,453 @@ class CodeEditorApp:
     def open_project(self):
         project_dir = filedialog.askdirectory(title="Select Project Directory")
         if project_dir:
+            self.autosave()  # Don't lose pending edits of the previous project
             self.project_path = project_dir
             file_path = os.path.join(self.project_path, "file.imgnb")
             
-            # Clear existing cells
-            for cell in self.cells:
-                cell.frame.destroy()
-            self.cells.clear()
-            
+            cells = []
+            settings = {}
             if os.path.exists(file_path):
-                with open(file_path, "r") as f:
-                    try:
-                        data = json.load(f)
-                        for cell_data in data.get("cells", []):
-                            self.add_cell(
-                                cell_data.get("title", ""), 
-                                cell_data.get("language", "python"), 
-                                cell_data.get("code", "")
-                            )
-                        if not data.get("cells"):
-                            self.add_cell()  # Add an empty cell if no cells exist
-                    except json.JSONDecodeError:
-                        messagebox.showwarning("Warning", "Project file is corrupted, creating a new one.")
-                        with open(file_path, "w") as f:
-                            json.dump({"cells": []}, f)
-                        self.add_cell()  # Add an empty cell
+                try:
+                    cells, settings = project.load_project(project_dir)
+                    if os.path.exists(project.journal_file(project_dir)):
+                        # Fold edits recovered from the autosave journal into the project file
+                        project.save_cells(project_dir, cells, settings)
+                except json.JSONDecodeError:
+                    backup_path = project.backup_corrupted(project_dir)
+                    messagebox.showwarning(
+                        "Warning", 
+                        f"Project file is corrupted, creating a new one.\nThe old file was kept as {os.path.basename(backup_path)}"
+                    )
+                    project.save_cells(project_dir, [])
             else:
-                with open(file_path, "w") as f:
-                    json.dump({"cells": []}, f)
-                self.add_cell()  # Add an empty cell
+                project.save_cells(project_dir, [])
+            self.journal = project.ProjectJournal(project_dir)
+            self.dirty_cells.clear()
+            self.set_settings(settings)
+            
+            if not cells:
+                cells = [project.Cell()]  # Add an empty cell if no cells exist
+                # Saved so journaled edits of it have a cell to apply to
+                project.save_cells(project_dir, cells, settings)
+            self.refresh_linked_cells(project_dir, cells)
+            # Cells stay plain data; widgets are only built for the visible ones
+            self.set_cells(cells)
             
             self.status_var.set(f"Opened project from {project_dir}")
             self.root.title(f"Code Editor - {os.path.basename(project_dir)}")
 
+    def refresh_linked_cells(self, project_dir, cells):
+        """Reload the code of cells linked to source files that changed since the project was saved"""
+        if not any(cell.source for cell in cells):
+            return
+        import watch
+        
+        changed, errors = watch.sync_cells(project_dir, cells)
+        for index in changed:
+            self.mark_dirty(cells[index])
+        if errors:
+            messagebox.showwarning(
+                "Warning",
+                "Some linked cells could not be refreshed:\n" + "\n".join(errors.values())
+            )
+
+    def set_settings(self, settings):
+        self.settings = settings
+        self.format_var.set(settings.get("format", encoders.DEFAULT_SETTINGS["format"]))
+
+    def on_format_change(self, event=None):
+        self.settings["format"] = self.format_var.get()
+        self.journal_entries([{"op": "settings", "settings": dict(self.settings)}])
+
+    def set_cells(self, cells):
+        self.cells = cells
+        self.search_index.reset(cells)
+        self.search_key = None
+        self.cell_list.set_cells(cells)
+        if self.index_pending is None:
+            self.index_pending = self.root.after_idle(self.index_step)
+
+    def index_step(self):
+        # Build the search index a few cells at a time so the window stays responsive
+        if self.search_index.refresh(SEARCH_INDEX_BATCH):
+            self.index_pending = self.root.after(1, self.index_step)
+        else:
+            self.index_pending = None
+
     def add_cell(self, title="", language="python", code=""):
-        cell = CodeCell(self.cell_frame, self, title, language, code)
+        cell = project.Cell(title, language, code)
         self.cells.append(cell)
-        cell.frame.pack(fill=tk.X, padx=5, pady=5, expand=True)
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        self.search_index.add(cell)
+        self.search_key = None
+        self.journal_entries([{"op": "insert", "index": len(self.cells) - 1, "cell": cell.to_dict()}])
         # Scroll to the new cell
-        self.canvas.yview_moveto(1.0)
+        self.cell_list.update_scrollregion()
+        self.cell_list.scroll_to(len(self.cells) - 1)
+
+    def remove_cell(self, index):
+        if len(self.cells) > 1:
+            self.cell_list.release_all()
+            self.dirty_cells.pop(id(self.cells[index]), None)
+            self.search_index.remove(self.cells[index])
+            self.search_key = None
+            del self.cells[index]
+            self.journal_entries([{"op": "remove", "index": index}])
+            self.cell_list.refresh()
+            self.status_var.set("Cell removed")
+        else:
+            self.status_var.set("Cannot remove the last cell")
+
+    def mark_dirty(self, cell):
+        self.dirty_cells[id(cell)] = cell
+        self.search_index.mark_stale(cell)
+        self.search_key = None
+
+    def on_search_key(self, event=None):
+        if event is not None and event.keysym in ("Return", "Escape", "Shift_L", "Shift_R"):
+            return
+        # Search once typing pauses rather than on every keystroke
+        if self.search_pending is not None:
+            self.root.after_cancel(self.search_pending)
+        self.search_pending = self.root.after(SEARCH_DELAY_MS, self.run_search)
+
+    def run_search(self):
+        """Find the cells matching the search bar and jump to the first one"""
+        self.search_pending = None
+        query = self.search_var.get()
+        regex = self.regex_var.get()
+        # Edits in the visible cells only reach the model (and the index) on sync
+        self.cell_list.sync()
+        try:
+            self.search_results = self.search_index.search(self.cells, query, regex)
+        except re.error as e:
+            self.search_results = []
+            self.search_key = None
+            self.search_status.set("Invalid regex")
+            self.status_var.set(f"Invalid regex: {e}")
+            return
+        self.search_key = (query, regex)
+        self.search_position = -1
+        if not query:
+            self.search_status.set("")
+        elif not self.search_results:
+            self.search_status.set("No matches")
+        else:
+            self.next_match(1)
+
+    def next_match(self, step):
+        if self.search_pending is not None:
+            self.root.after_cancel(self.search_pending)
+            self.search_pending = None
+        if self.search_key != (self.search_var.get(), self.regex_var.get()):
+            # The query or the cells changed since the last search
+            self.run_search()
+            return "break"
+        if not self.search_results:
+            return "break"
+        self.search_position = (self.search_position + step) % len(self.search_results)
+        index = self.search_results[self.search_position]
+        self.search_status.set(f"{self.search_position + 1} of {len(self.search_results)}")
+        self.cell_list.scroll_to(index)
+        view = self.cell_list.views.get(index)
+        if view is not None:
+            view.show_matches(self.search_var.get(), self.regex_var.get())
+        return "break"
+
+    def clear_search(self, event=None):
+        self.search_var.set("")
+        self.search_results = []
+        self.search_key = None
+        self.search_status.set("")
+        for view in self.cell_list.views.values():
+            view.show_matches("")
+
+    def journal_entries(self, entries):
+        if self.journal is None:
+            return
+        try:
+            self.journal.append(entries)
+        except OSError as e:
+            self.status_var.set(f"Autosave failed: {str(e)}")
+
+    def autosave(self):
+        """Append the cells edited since the last autosave to the project journal"""
+        if self.journal is None or not self.dirty_cells:
+            return
+        
+        self.cell_list.sync()
+        entries = []
+        for index, cell in enumerate(self.cells):
+            if id(cell) in self.dirty_cells:
+                entries.append({"op": "set", "index": index, "cell": cell.to_dict()})
+        self.dirty_cells.clear()
+        self.journal_entries(entries)
+        
+        if self.journal.needs_compaction():
+            project.save_cells(self.project_path, self.get_cells_data(), self.settings)
+
+    def autosave_tick(self):
+        self.autosave()
+        self.root.after(AUTOSAVE_MS, self.autosave_tick)
+
+    def on_close(self):
+        self.autosave()
+        self.root.destroy()
+
+    def get_cells_data(self):
+        """Cell data as saved to file.imgnb, including unsaved edits in the visible cells"""
+        self.cell_list.sync()
+        return [cell.copy(code=cell.code.strip()) for cell in self.cells]
 
     def download_all(self):
         if not self.project_path:
             self.status_var.set("No project opened. Please open or create a project first.")
             return
         
-        images_folder = os.path.join(self.project_path, "images")
-        os.makedirs(images_folder, exist_ok=True)
+        self.save_project()
+        images_folder = project.images_folder(self.project_path)
+        self.start_export(self.get_cells_data(), images_folder)
+
+    def start_export(self, cells, folder, include_circles=False, single=False):
+        """
+        Export ``cells`` (project.Cell objects) on a worker thread; progress
+        comes back through a polled queue. ``single`` marks a one-cell
+        "Download as Image" rather than "Download All".
+        """
+        if self.export_thread is not None:
+            self.status_var.set("An export is already running")
+            return False
+        
+        import exporter
+        import render_cache
+        
+        try:
+            workers = self.workers_var.get()
+        except tk.TclError:
+            workers = exporter.default_workers()
+        try:
+            options = {"max_lines": self.max_lines_var.get() or None}
+        except tk.TclError:
+            options = {}
+        options["output"] = dict(self.settings)
+        options["scales"] = self.scales_var.get().split(", ")
+        
+        # Snapshot the cells now: the worker thread must not see later edits
+        data = [cell.copy() for cell in cells]
+        total = sum(1 for cell in data if cell.code.strip())
+        cache = render_cache.RenderCache(self.project_path) if self.project_path else None
+        export_queue = queue.Queue()
+        cancel = threading.Event()
+        stats = {}
+        
+        def progress(index, image_paths, error):
+            export_queue.put(("progress", index, image_paths, error))
+        
+        def run():
+            try:
+                results = exporter.export_cells(
+                    data, folder, workers, include_circles, cache, progress=progress, cancel=cancel,
+                    options=options, stats=stats
+                )
+                export_queue.put(("done", results))
+            except Exception as e:
+                traceback.print_exc()  # Print detailed error for debugging
+                export_queue.put(("failed", e))
+        
+        self.export_queue = export_queue
+        self.export_cancel = cancel
+        self.export_data = data
+        self.export_folder = folder
+        self.export_single = single
+        self.export_cache = cache
+        self.export_done = 0
+        self.export_total = total
+        self.export_workers = workers
+        self.export_stats = stats
+        self.export_started = time.perf_counter()
+        
+        self.export_progress.configure(maximum=max(total, 1), value=0)
+        self.cancel_export_button.pack(side=tk.RIGHT, padx=(5, 0))
+        self.export_progress.pack(side=tk.RIGHT, padx=(5, 0))
+        self.cancel_export_button.state(["!disabled"])
+        self.download_all_button.state(["disabled"])
+        self.status_var.set(f"Exporting {total} cells...")
+        
+        self.export_thread = threading.Thread(target=run, daemon=True)
+        self.export_thread.start()
+        self.root.after(100, self.poll_export)
+        return True
+
+    def export_sheet(self):
+        """Save the matching cells (or all of them) as one contact sheet PNG or a multi-page PDF"""
+        if self.sheet_thread is not None:
+            self.status_var.set("A sheet export is already running")
+            return
+        
+        cells = self.get_cells_data()
+        if self.search_var.get() and self.search_key == (self.search_var.get(), self.regex_var.get()):
+            # Only the cells found by the current search
+            cells = [cells[index] for index in self.search_results]
+        cells = [cell for cell in cells if cell.code]
+        if not cells:
+            self.status_var.set("No cells with code to put on the sheet")
+            return
+        
+        initial_dir = project.images_folder(self.project_path) if self.project_path else None
+        path = filedialog.asksaveasfilename(
+            defaultextension=".png",
+            initialdir=initial_dir,
+            initialfile="sheet.png",
+            filetypes=[("PNG contact sheet", "*.png"), ("PDF", "*.pdf")],
+            title="Export Sheet",
+        )
+        if not path:
+            return
+        
+        import sheet
+        
+        sheet_queue = queue.Queue()
+        
+        def progress(done, total):
+            sheet_queue.put(("progress", done, total))
+        
+        def run():
+            try:
+                sheet_queue.put(("done", sheet.export_sheet(cells, path, progress=progress)))
+            except Exception as e:
+                traceback.print_exc()
+                sheet_queue.put(("failed", e))
+        
+        self.sheet_queue = sheet_queue
+        self.sheet_path = path
+        self.sheet_cells = cells
+        self.sheet_button.state(["disabled"])
+        self.status_var.set(f"Laying out {len(cells)} cells...")
+        self.sheet_thread = threading.Thread(target=run, daemon=True)
+        self.sheet_thread.start()
+        self.root.after(100, self.poll_sheet)
+
+    def poll_sheet(self):
+        while True:
+            try:
+                message = self.sheet_queue.get_nowait()
+            except queue.Empty:
+                break
+            
+            kind = message[0]
+            if kind == "progress":
+                self.status_var.set(f"Painting sheet: {message[1]}/{message[2]} snippets")
+                continue
+            self.sheet_thread = None
+            self.sheet_button.state(["!disabled"])
+            if kind == "done":
+                pages, errors = message[1]
+                pages = f" ({pages} pages)" if pages > 1 else ""
+                if errors:
+                    index, error = errors[0]
+                    self.status_var.set(f"Saved: {self.sheet_path}{pages}, {len(errors)} cells left out "
+                                        f"({self.sheet_cells[index].title or 'untitled'}: {error})")
+                else:
+                    self.status_var.set(f"Saved: {self.sheet_path}{pages}")
+            else:
+                self.status_var.set(f"Error exporting sheet: {message[1]}")
+            return
+        
+        self.root.after(100, self.poll_sheet)
+
+    def poll_export(self):
+        while True:
+            try:
+                message = self.export_queue.get_nowait()
+            except queue.Empty:
+                break
+            
+            kind = message[0]
+            if kind == "progress":
+                _, index, image_paths, error = message
+                self.export_done += 1
+                self.export_progress.configure(value=self.export_done)
+                title = self.export_data[index].title or "untitled"
+                if error:
+                    self.status_var.set(f"Error exporting {title}: {error}")
+                else:
+                    self.status_var.set(f"Exported {self.export_done}/{self.export_total}: {title}")
+            elif kind == "done":
+                self.finish_export(message[1])
+                return
+            else:
+                self.finish_export(None, message[1])
+                return
+        
+        self.root.after(100, self.poll_export)
+
+    def finish_export(self, results, exception=None):
+        self.export_thread = None
+        self.export_progress.pack_forget()
+        self.cancel_export_button.pack_forget()
+        self.download_all_button.state(["!disabled"])
+        self.export_wall = time.perf_counter() - self.export_started
+        if self.stats_panel is not None:
+            self.stats_panel.refresh()
+        
+        if exception is not None:
+            self.status_var.set(f"Error exporting image: {str(exception)}")
+            return
         
         success_count = 0
-        for cell in self.cells:
-            if cell.download_image(images_folder):
+        failures = []
+        last_saved = None
+        for index, image_paths, error in results:
+            if error:
+                failures.append(f"{self.export_data[index].title or 'untitled'}: {error}")
+            else:
                 success_count += 1
+                last_saved = image_paths
         
-        self.save_project()
-        self.status_var.set(f"Downloaded {success_count} images to {images_folder}")
+        folder = self.export_folder
+        if self.export_cancel.is_set():
+            self.status_var.set(f"Export cancelled: {success_count} images saved to {folder}")
+        elif self.export_single:
+            # Single "Download as Image" export
+            if failures:
+                self.status_var.set(f"Error exporting image: {failures[0].split(': ', 1)[1]}")
+            elif last_saved is None:
+                self.status_var.set("Cannot export empty code cell")
+            else:
+                pages = f" ({len(last_saved)} pages)" if len(last_saved) > 1 else ""
+                self.status_var.set(f"Saved: {last_saved[0]}{pages}")
+        elif not results:
+            self.status_var.set("No cells with code to export")
+        elif failures:
+            self.status_var.set(f"Downloaded {success_count} images to {folder}, {len(failures)} failed ({failures[0]})")
+        else:
+            unchanged = self.export_cache.hits if self.export_cache else 0
+            self.status_var.set(f"Downloaded {success_count} images to {folder} ({unchanged} unchanged)")
+
+    def show_stats(self):
+        if self.stats_panel is None:
+            self.stats_panel = StatsPanel(self)
+        else:
+            self.stats_panel.window.lift()
+
+    def cancel_export(self):
+        if self.export_thread is not None:
+            self.export_cancel.set()
+            self.cancel_export_button.state(["disabled"])
+            self.status_var.set("Cancelling export...")
 
     def save_project(self):
         if not self.project_path:
             self.status_var.set("No project opened. Please open or create a project first.")
             return
         
-        file_path = os.path.join(self.project_path, "file.imgnb")
-        data = {"cells": []}
-        
-        for cell in self.cells:
-            data["cells"].append({
-                "title": cell.title_entry.get(),
-                "language": cell.language.get(),
-                "code": cell.text.get("1.0", tk.END).strip()
-            })
-        
-        with open(file_path, "w") as f:
-            json.dump(data, f, indent=4)
+        try:
+            project.save_cells(self.project_path, self.get_cells_data(), self.settings)
+        except OSError as e:
+            self.status_var.set(f"Error saving project: {str(e)}")
+            return
+        self.dirty_cells.clear()
+        self.journal = project.ProjectJournal(self.project_path)
         
         self.status_var.set("Project saved successfully!")
 
@@ -228,47 +743,332 @@ class CodeEditorApp:
             else:
                 os.startfile(folder)
 
+class StatsPanel:
+    """Window listing the per-stage timings of the last export, slowest cells first"""
+
+    # (stats key, heading, column width)
+    COLUMNS = (
+        ("title", "Cell", 160),
+        ("language", "Language", 80),
+        ("lines", "Lines", 50),
+        ("size", "Size", 90),
+        ("bytes", "KB", 60),
+        ("wall", "Total ms", 70),
+    )
+    STAGES = ("lex", "layout", "rasterize", "chrome", "stream", "encode", "write", "cache")
+
+    def __init__(self, app):
+        self.app = app
+        self.window = tk.Toplevel(app.root)
+        self.window.title("Export Stats")
+        self.window.geometry("1000x400")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        self.summary_var = tk.StringVar()
+        ttk.Label(self.window, textvariable=self.summary_var, padding=5).pack(fill=tk.X)
+        
+        tree_frame = ttk.Frame(self.window)
+        tree_frame.pack(fill=tk.BOTH, expand=True, padx=5)
+        columns = [key for key, _, _ in self.COLUMNS] + list(self.STAGES)
+        self.tree = ttk.Treeview(tree_frame, columns=columns, show="headings")
+        for key, heading, width in self.COLUMNS:
+            self.tree.heading(key, text=heading)
+            self.tree.column(key, width=width, anchor=tk.W if key in ("title", "language") else tk.E)
+        for stage in self.STAGES:
+            self.tree.heading(stage, text=f"{stage.capitalize()} ms")
+            self.tree.column(stage, width=70, anchor=tk.E)
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        button_frame = ttk.Frame(self.window)
+        button_frame.pack(fill=tk.X, pady=5)
+        ttk.Button(button_frame, text="Close", command=self.close).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Save Trace...", command=self.save_trace).pack(side=tk.RIGHT, padx=5)
+        
+        self.refresh()
+
+    def refresh(self):
+        self.tree.delete(*self.tree.get_children())
+        stats = self.app.export_stats
+        if not stats or self.app.export_thread is not None:
+            self.summary_var.set("No export stats yet" if not stats else "Export running...")
+            return
+        
+        totals = {}
+        for index, record in sorted(stats.items(), key=lambda item: item[1]["wall"], reverse=True):
+            pages = record["pages"]
+            sizes = [page["size"] for page in pages if page["size"]]
+            size = f"{sizes[0][0]}x{sum(height for _, height in sizes)}" if sizes else ""
+            values = [
+                record["title"] + (" (cached)" if record["cached"] else ""),
+                record["language"],
+                record["lines"],
+                size,
+                f"{sum(page['bytes'] for page in pages) / 1024:.1f}",
+                f"{record['wall'] * 1000:.1f}",
+            ]
+            for stage in self.STAGES:
+                seconds = record["stages"].get(stage)
+                values.append(f"{seconds * 1000:.1f}" if seconds is not None else "")
+                totals[stage] = totals.get(stage, 0.0) + (seconds or 0.0)
+            self.tree.insert("", tk.END, iid=str(index), values=values)
+        
+        slowest = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:3]
+        breakdown = ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in slowest if seconds)
+        self.summary_var.set(
+            f"{len(stats)} cells in {self.app.export_wall:.2f} s with {self.app.export_workers} workers"
+            + (f" (most time: {breakdown})" if breakdown else "")
+        )
+
+    def save_trace(self):
+        if not self.app.export_stats:
+            return
+        path = filedialog.asksaveasfilename(
+            parent=self.window, 
+            title="Save Export Trace", 
+            defaultextension=".json", 
+            initialfile="export-trace.json", 
+            filetypes=[("JSON files", "*.json")]
+        )
+        if path:
+            import exporter
+            exporter.write_trace(
+                path, self.app.export_stats, folder=self.app.export_folder, 
+                workers=self.app.export_workers, wall=self.app.export_wall
+            )
+            self.app.status_var.set(f"Saved export trace to {path}")
+
+    def close(self):
+        self.app.stats_panel = None
+        self.window.destroy()
+
+
+class VirtualCellList:
+    """
+    Scrolling list of cells that only builds CodeCell widgets for the cells in
+    or near the viewport. Every cell is a fixed-height slot on the canvas; the
+    cells themselves are plain project.Cell objects, and widgets scrolled out
+    of view are recycled to show other cells after writing their edits back.
+    """
+
+    OVERSCAN = 1  # Extra cells kept built above and below the viewport
+    PADDING = 5
+
+    def __init__(self, parent, app):
+        self.app = app
+        self.cells = []
+        self.views = {}        # cell index -> CodeCell showing it
+        self.spare_views = []  # built CodeCells waiting to be reused
+        self.slot_height = None
+        self.update_pending = False
+        
+        self.canvas = tk.Canvas(parent)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self.on_scroll)
+        
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        # Configure cells to resize with the window
+        self.canvas.bind("<Configure>", self.on_canvas_configure)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.schedule_update()
+
+    def on_canvas_configure(self, event):
+        # Update the width of the cells to fit the canvas
+        for view in self.views.values():
+            self.canvas.itemconfig(view.window, width=self.view_width())
+        self.update_scrollregion()
+        self.schedule_update()
+
+    def view_width(self):
+        return max(self.canvas.winfo_width() - self.PADDING * 2, 1)
+
+    def schedule_update(self):
+        # Coalesce bursts of scroll/resize events into one update
+        if not self.update_pending:
+            self.update_pending = True
+            self.canvas.after_idle(self.update_views)
+
+    def set_cells(self, cells):
+        self.release_all()
+        self.cells = cells
+        self.canvas.yview_moveto(0)
+        self.refresh()
+
+    def refresh(self):
+        """Re-layout after cells were added or removed"""
+        self.release_all()
+        self.update_scrollregion()
+        self.update_views()
+
+    def update_scrollregion(self):
+        height = len(self.cells) * self.get_slot_height() if self.cells else 0
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), height))
+
+    def get_slot_height(self):
+        if self.slot_height is None:
+            # Every cell has the same layout, so measure one and reuse the height
+            view = self.take_view()
+            view.frame.update_idletasks()
+            self.slot_height = view.frame.winfo_reqheight() + self.PADDING * 2
+            self.spare_views.append(view)
+        return self.slot_height
+
+    def take_view(self):
+        if self.spare_views:
+            return self.spare_views.pop()
+        view = CodeCell(self.canvas, self.app)
+        view.window = self.canvas.create_window(
+            self.PADDING, -10000, window=view.frame, anchor="nw", width=self.view_width()
+        )
+        return view
+
+    def update_views(self):
+        self.update_pending = False
+        if not self.cells:
+            self.release_all()
+            return
+        
+        slot_height = self.get_slot_height()
+        top = self.canvas.canvasy(0)
+        bottom = self.canvas.canvasy(self.canvas.winfo_height())
+        first = max(int(top // slot_height) - self.OVERSCAN, 0)
+        last = min(int(bottom // slot_height) + self.OVERSCAN, len(self.cells) - 1)
+        
+        for index in list(self.views):
+            if index < first or index > last:
+                self.release(index)
+        
+        for index in range(first, last + 1):
+            if index not in self.views:
+                view = self.take_view()
+                view.bind(index, self.cells[index])
+                self.canvas.coords(view.window, self.PADDING, index * slot_height + self.PADDING)
+                self.canvas.itemconfig(view.window, width=self.view_width())
+                self.views[index] = view
+
+    def release(self, index):
+        view = self.views.pop(index)
+        focused = str(self.canvas.tk.call("focus"))
+        if focused == str(view.frame) or focused.startswith(str(view.frame) + "."):
+            # Don't leave keyboard focus in a widget that is about to show another cell
+            self.canvas.focus_set()
+        view.unbind()
+        self.canvas.coords(view.window, self.PADDING, -10000)
+        self.spare_views.append(view)
+
+    def release_all(self):
+        for index in list(self.views):
+            self.release(index)
+
+    def sync(self):
+        """Write edits in the visible widgets back into their cells"""
+        for view in self.views.values():
+            view.sync()
+
+    def scroll_to(self, index):
+        if self.cells:
+            self.canvas.yview_moveto(index / len(self.cells))
+            self.update_views()
+
 class LineNumbers(tk.Canvas):
+    """
+    Line-number gutter for a Text widget. Bursts of events are merged into a
+    single redraw on the next idle cycle, and a redraw only touches the
+    numbers whose text or position actually changed.
+    """
+
     def __init__(self, parent, text_widget, **kwargs):
         tk.Canvas.__init__(self, parent, **kwargs)
         self.text_widget = text_widget
-        self.text_widget.bind('<KeyRelease>', self.redraw)
-        self.text_widget.bind('<Configure>', self.redraw)
-        self.text_widget.bind('<<Change>>', self.redraw)
-        self.text_widget.bind('<MouseWheel>', self.redraw)
-        self.text_widget.bind('<Button-1>', self.redraw)  # Redraw on click
-        self.text_widget.bind('<FocusIn>', self.redraw)   # Redraw when getting focus
+        self.text_widget.bind('<KeyRelease>', self.schedule_redraw, add="+")
+        self.text_widget.bind('<Configure>', self.schedule_redraw, add="+")
+        self.text_widget.bind('<<Change>>', self.schedule_redraw, add="+")
+        self.text_widget.bind('<Button-1>', self.schedule_redraw, add="+")  # Redraw on click
+        self.text_widget.bind('<FocusIn>', self.schedule_redraw, add="+")   # Redraw when getting focus
         
         self.font = font.Font(family="Consolas", size=11)
+        self.redraw_pending = None
+        self.items = []   # canvas text item per visible row
+        self.drawn = []   # (line number, y) currently shown by each item
+        self.x_pos = None
+        
+    def schedule_redraw(self, *args):
+        if self.redraw_pending is None:
+            self.redraw_pending = self.after_idle(self.redraw)
+
+    def fit_width(self):
+        """Resize the gutter to fit the number of digits in the last line number"""
+        line_count = int(self.text_widget.index("end-1c").split('.')[0])
+        width = self.font.measure("9" * len(str(line_count))) + 12
+        if int(self.cget("width")) != width:
+            self.configure(width=width)
         
     def redraw(self, *args):
         """Redraw line numbers"""
-        self.delete("all")
+        if self.redraw_pending is not None:
+            self.after_cancel(self.redraw_pending)
+            self.redraw_pending = None
+        
+        self.fit_width()
         
         # Get the first and last visible line
-        first_index = self.text_widget.index("@0,0")
-        last_index = self.text_widget.index(f"@0,{self.text_widget.winfo_height()}")
+        first_line = int(self.text_widget.index("@0,0").split('.')[0])
+        last_line = int(self.text_widget.index(f"@0,{self.text_widget.winfo_height()}").split('.')[0])
         
-        first_line = int(first_index.split('.')[0])
-        last_line = int(last_index.split('.')[0])
+        # With no wrapping every line has the same height, so one lookup places them all
+        info = self.text_widget.dlineinfo(f"{first_line}.0")
+        rows = []
+        if info is not None:
+            y_start, line_height = info[1], info[3]
+            rows = [(line_num, y_start + (line_num - first_line) * line_height)
+                    for line_num in range(first_line, last_line + 1)]
         
-        # Draw line numbers
-        y_pos = 2  # Starting y position
-        for line_num in range(first_line, last_line + 1):
-            line_text = str(line_num)
-            x_pos = self.winfo_width() - 5  # Right-aligned
+        x_pos = int(self.cget("width")) - 5  # Right-aligned
+        if x_pos != self.x_pos:
+            # Gutter width changed: every number has to move
+            self.x_pos = x_pos
+            self.drawn = [None] * len(self.drawn)
+        
+        # Update the numbers that changed, reusing canvas items
+        for row, (line_num, y_pos) in enumerate(rows):
+            if row == len(self.items):
+                self.items.append(self.create_text(x_pos, y_pos, anchor='ne', text=str(line_num),
+                                                   font=self.font, fill="#606060"))
+                self.drawn.append((line_num, y_pos))
+                continue
             
-            # Get y coordinate of line
-            index = f"{line_num}.0"
-            bbox = self.text_widget.bbox(index)
-            if bbox is not None:
-                y_pos = bbox[1]  # Use actual y position
-                self.create_text(x_pos, y_pos, anchor='ne', text=line_text, 
-                                font=self.font, fill="#606060")
+            previous = self.drawn[row]
+            if previous is None or previous[0] != line_num:
+                self.itemconfigure(self.items[row], text=str(line_num), state="normal")
+            if previous is None or previous[1] != y_pos:
+                self.coords(self.items[row], x_pos, y_pos)
+            self.drawn[row] = (line_num, y_pos)
+        
+        # Hide rows that are no longer needed
+        for row in range(len(rows), len(self.items)):
+            if self.drawn[row] != (None, None):
+                self.itemconfigure(self.items[row], state="hidden")
+                self.drawn[row] = (None, None)
 
 class CodeCell:
-    def __init__(self, parent, app, title="", language="python", code=""):
+    """Editor widgets for one cell; VirtualCellList binds it to whichever cell it shows"""
+
+    def __init__(self, parent, app):
         self.app = app
+        self.index = None
+        self.cell = None
+        self.window = None
+        
+        # Live syntax highlighting
+        self.highlighter = None
+        self.highlight_pending = None
+        self.token_tags = set()
         
         # Create a frame with better appearance
         self.frame = ttk.Frame(parent, style="Card.TFrame")
@@ -282,7 +1082,7 @@ class CodeCell:
         ttk.Label(self.header_frame, text="Title:").pack(side=tk.LEFT, padx=(0, 5))
         self.title_entry = ttk.Entry(self.header_frame, width=40)
         self.title_entry.pack(side=tk.LEFT, padx=(0, 10), fill=tk.X, expand=True)
-        self.title_entry.insert(0, title)
+        self.title_entry.bind("<KeyRelease>", self.on_edit)
         
         # Language selection
         ttk.Label(self.header_frame, text="Language:").pack(side=tk.LEFT, padx=(0, 5))
@@ -295,7 +1095,7 @@ class CodeCell:
             width=15
         )
         self.language_dropdown.pack(side=tk.LEFT, padx=(0, 10))
-        self.language_dropdown.set(language)
+        self.language_dropdown.bind("<<ComboboxSelected>>", self.on_language_change)
         
         # Code editor frame
         self.editor_frame = ttk.Frame(self.frame, borderwidth=1, relief="sunken")
@@ -333,24 +1133,21 @@ class CodeCell:
         # Add scrollbars
         self.y_scrollbar = ttk.Scrollbar(self.editor_frame, orient="vertical", command=self.text.yview)
         self.x_scrollbar = ttk.Scrollbar(self.editor_frame, orient="horizontal", command=self.text.xview)
-        self.text.configure(yscrollcommand=self.y_scrollbar.set, xscrollcommand=self.x_scrollbar.set)
+        self.text.configure(yscrollcommand=self.on_text_scroll, xscrollcommand=self.x_scrollbar.set)
         
         # Pack everything
         self.y_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.x_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
         self.text.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
         
-        # Insert initial code
-        self.text.insert("1.0", code)
-        
         # Add tab support
         self.text.bind("<Tab>", self.handle_tab)
         
         # Handle mousewheel for text widget scrolling
         self.text.bind("<MouseWheel>", self.on_mousewheel)
         
-        # Force redraw of line numbers when text widget scrolls
-        self.text.bind("<<ScrolledText>>", lambda e: self.line_numbers.redraw())
+        # Track edits for autosave
+        self.text.bind("<<Modified>>", self.on_text_modified)
         
         # Bottom toolbar for actions
         self.button_frame = ttk.Frame(self.frame)
@@ -373,6 +1170,14 @@ class CodeCell:
         )
         self.copy_button.pack(side=tk.LEFT, padx=(0, 5))
         
+        self.link_button = ttk.Button(
+            self.button_frame, 
+            text="Link File...", 
+            command=self.link_file,
+            width=15
+        )
+        self.link_button.pack(side=tk.LEFT, padx=(0, 5))
+        
         self.remove_button = ttk.Button(
             self.button_frame, 
             text="Remove Cell", 
@@ -382,178 +1187,246 @@ class CodeCell:
         self.remove_button.pack(side=tk.RIGHT)
         
         # Force initial line numbers update
-        self.line_numbers.redraw()
+        self.line_numbers.schedule_redraw()
 
     def on_mousewheel(self, event):
         # Scroll the text widget (not the main canvas)
         self.text.yview_scroll(int(-1*(event.delta/120)), "units")
-        # Update line numbers when scrolling
-        self.line_numbers.redraw()
         # Stop propagation to prevent the main canvas from scrolling
         return "break"
 
+    def on_text_scroll(self, first, last):
+        self.y_scrollbar.set(first, last)
+        # Any scroll, however it was caused, moves the line numbers
+        self.line_numbers.schedule_redraw()
+
+    def on_text_modified(self, event):
+        if self.text.edit_modified():
+            # Reset the flag so the next edit fires <<Modified>> again
+            self.text.edit_modified(False)
+            self.on_edit()
+            self.schedule_highlight()
+
+    def on_edit(self, event=None):
+        if self.cell is not None:
+            self.app.mark_dirty(self.cell)
+
+    def on_language_change(self, event=None):
+        self.on_edit()
+        self.schedule_highlight()
+
+    def schedule_highlight(self):
+        # Re-lex at most once per burst of keystrokes
+        if self.highlight_pending is None:
+            self.highlight_pending = self.text.after(30, self.highlight)
+
+    def clear_highlight(self):
+        for tag in self.token_tags:
+            self.text.tag_remove(tag, "1.0", tk.END)
+        self.highlighter = None
+
+    def highlight(self):
+        """Re-color the lines whose tokens changed since the last highlight"""
+        import highlighter
+        
+        self.highlight_pending = None
+        if self.cell is None:
+            return
+        
+        language = self.language.get()
+        if self.highlighter is None or self.highlighter.language != language:
+            self.clear_highlight()
+            try:
+                self.highlighter = highlighter.IncrementalHighlighter(language)
+            except Exception:
+                return  # Unknown language: leave the code uncolored
+        
+        changed = self.highlighter.update(self.text.get("1.0", "end-1c"))
+        if changed is None:
+            return
+        first, last = changed
+        
+        for tag in self.token_tags:
+            self.text.tag_remove(tag, f"{first + 1}.0", f"{last + 1}.0")
+        
+        # One tag_add call per token type for the whole range
+        ranges = {}
+        for line in range(first, last):
+            for start, end, ttype in self.highlighter.line_tokens[line]:
+                ranges.setdefault(ttype, []).extend((f"{line + 1}.{start}", f"{line + 1}.{end}"))
+        
+        for ttype, indices in ranges.items():
+            tag = str(ttype)
+            if tag not in self.token_tags:
+                color = highlighter.token_color(highlighter.EDITOR_STYLE, ttype)
+                if color:
+                    self.text.tag_configure(tag, foreground=color)
+                self.token_tags.add(tag)
+                # Keep the selection visible above the token colors
+                self.text.tag_raise("sel")
+            self.text.tag_add(tag, *indices)
+
+    def show_matches(self, query, regex=False):
+        """Highlight the search matches in this cell's code and scroll to the first"""
+        self.text.tag_remove("search", "1.0", tk.END)
+        if not query:
+            return
+        pattern = re.compile(query if regex else re.escape(query), re.IGNORECASE | re.MULTILINE)
+        first = None
+        for match in pattern.finditer(self.text.get("1.0", "end-1c")):
+            if match.end() > match.start():
+                start, end = f"1.0+{match.start()}c", f"1.0+{match.end()}c"
+                self.text.tag_add("search", start, end)
+                first = first or start
+        self.text.tag_configure("search", background="#FFE066")
+        self.text.tag_raise("search")
+        if first:
+            self.text.see(first)
+
     def handle_tab(self, event):
         # Insert spaces instead of a tab character
         self.text.insert(tk.INSERT, "    ")
         return "break"  # Prevent default tab behavior
 
+    def bind(self, index, cell):
+        """Show ``cell`` (the project.Cell at ``index`` in app.cells) in these widgets"""
+        self.index = index
+        self.cell = None  # Loading the widgets is not an edit
+        
+        self.title_entry.delete(0, tk.END)
+        self.title_entry.insert(0, cell.title)
+        self.language_dropdown.set(cell.language)
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", cell.code)
+        self.text.edit_modified(False)
+        self.cell = cell
+        # Undo history belongs to the previous cell
+        self.text.edit_reset()
+        self.text.mark_set(tk.INSERT, "1.0")
+        self.text.yview_moveto(0)
+        self.line_numbers.schedule_redraw()
+        # Tags were removed with the old text; lex the new cell from scratch
+        self.highlighter = None
+        self.schedule_highlight()
+
+    def sync(self):
+        """Write the widget contents back into the bound cell"""
+        if self.cell is not None:
+            # Only assign what changed, so the cell keeps its cached content hash
+            for name, value in (
+                ("title", self.title_entry.get()),
+                ("language", self.language.get()),
+                ("code", self.text.get("1.0", "end-1c")),
+            ):
+                if getattr(self.cell, name) != value:
+                    setattr(self.cell, name, value)
+
+    def unbind(self):
+        self.sync()
+        self.index = None
+        self.cell = None
+
+    def get_data(self):
+        self.sync()
+        return self.cell.copy(code=self.cell.code.strip())
+
+    def link_file(self):
+        """Link this cell to a file (optionally a line range or named region) that watch mode keeps it in sync with"""
+        import watch
+        from tkinter import simpledialog
+        
+        if self.cell is None:
+            return
+        path = filedialog.askopenfilename(title="Select Source File", initialdir=self.app.project_path or None)
+        if not path:
+            return
+        part = simpledialog.askstring(
+            "Link File",
+            "Lines (e.g. 10-40) or region name; leave empty for the whole file:",
+            parent=self.frame
+        )
+        if part is None:
+            return
+        
+        # Paths inside the project are stored relative to it, so the project can be moved
+        if self.app.project_path:
+            relative = os.path.relpath(path, self.app.project_path)
+            if not relative.startswith(os.pardir):
+                path = relative
+        source = {"path": path}
+        part = part.strip()
+        if part:
+            first, dash, last = part.partition("-")
+            if first.strip().isdigit() and (not dash or last.strip().isdigit()):
+                source["lines"] = [int(first), int(last if dash else first)]
+            else:
+                source["region"] = part
+        
+        try:
+            with open(watch.source_path(self.app.project_path or "", source), "r", encoding="utf-8") as f:
+                code = watch.extract_snippet(f.read(), source)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            messagebox.showerror("Error", f"Failed to link file: {str(e)}")
+            return
+        
+        self.cell.source = source
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", code)
+        if not self.title_entry.get().strip():
+            self.title_entry.insert(0, os.path.basename(source["path"]))
+        self.on_edit()
+        self.app.status_var.set(f"Linked to {watch.describe_source(source)}")
+
     def download_image(self, folder=None, include_circles=False):
-        title = self.title_entry.get().strip() or "untitled"
-        code = self.text.get("1.0", tk.END).strip()
-        lang = self.language.get()
+        data = self.get_data()
         
-        if not code:
+        if not data.code:
             self.app.status_var.set("Cannot export empty code cell")
             return False
         
-        try:
-            lexer = get_lexer_by_name(lang, stripall=True)
-            
-            # Create custom formatter with Carbon.sh-inspired styling
-            formatter = ImageFormatter(
-                font_name="Consolas",
-                font_size=14,
-                line_numbers=True,
-                line_number_bg="#DFE0E1", #"#222831",  # Darker background for line numbers
-                line_number_fg="#606F85",  # Subtle color for line numbers
-                line_number_bold=False,    # More subtle line numbers
-                style="default", # "github-dark",    # Modern dark theme
-                image_padding=30,          # More generous padding
-                image_bg="#DFE0E1",        # Dark background (matches Carbon default)
-                line_pad=6,                # Better line spacing
-                line_number_separator=False # Remove the separator line
-            )
-            
-            highlighted_code = highlight(code, lexer, formatter)
-            
-            # Determine the folder to save in
-            if folder is None and self.app.project_path:
-                folder = os.path.join(self.app.project_path, "images")
-                os.makedirs(folder, exist_ok=True)
-            
-            if folder:
-                # Create a clean filename
-                clean_title = "".join(c if c.isalnum() or c in " -_" else "_" for c in title)
-                image_path = os.path.join(folder, f"{clean_title}.png")
-                
-                # Open the base image
-                img = Image.open(io.BytesIO(highlighted_code))
-                width, height = img.size
-                
-                # Create a new image with rounded corners and padding
-                # Add extra space for title and add gradient background
-                title_height = 25
-                title_size = 15
-                new_height = height + title_height if title else height
-                new_img = Image.new('RGBA', (width, new_height), (0, 0, 0, 0))
-                
-                # Create a gradient background
-                background = Image.new('RGBA', (width, new_height), (0, 0, 0, 0))
-                draw = ImageDraw.Draw(background)
-                
-                # Create gradient from top to bottom
-                for y in range(new_height):
-                    # Gradient from #1F2430 to slightly lighter #262D3D
-                    r = int(31 + (y / new_height) * 7)
-                    g = int(36 + (y / new_height) * 9)
-                    b = int(48 + (y / new_height) * 13)
-                    draw.line([(0, y), (width, y)], fill=(r, g, b))
-                
-                # Add rounded corners to the background
-                radius = 12
-                circle = Image.new('L', (radius * 2, radius * 2), 0)
-                draw = ImageDraw.Draw(circle)
-                draw.ellipse((0, 0, radius * 2, radius * 2), fill=255)
-                
-                # Apply rounded corners to the background
-                alpha = Image.new('L', background.size, 255)
-                # Top left
-                alpha.paste(circle.crop((0, 0, radius, radius)), (0, 0))
-                # Top right
-                alpha.paste(circle.crop((radius, 0, radius * 2, radius)), (width - radius, 0))
-                # Bottom left
-                alpha.paste(circle.crop((0, radius, radius, radius * 2)), (0, new_height - radius))
-                # Bottom right
-                alpha.paste(circle.crop((radius, radius, radius * 2, radius * 2)), (width - radius, new_height - radius))
-                
-                # Apply the alpha mask to the background
-                background.putalpha(alpha)
-                
-                # Paste the original image onto the new background
-                y_offset = title_height if title else 0
-                new_img.paste(background, (0, 0))
-                new_img.paste(img, (0, y_offset), img if img.mode == 'RGBA' else None)
-                
-                # Add a window control UI element for that modern app look
-                if title:
-                    draw = ImageDraw.Draw(new_img)
-                    # Draw title text
-                    try:
-                        title_font = ImageFont.truetype("arial.ttf", title_size)
-                    except IOError:
-                        print("Font not found")
-                        title_font = ImageFont.load_default()
-                    
-                    # # Add window controls (circles) for the macOS look
-                    if include_circles:                   
-                        circle_y = 25
-                        # Red circle
-                        draw.ellipse((15, circle_y - 6, 15 + 12, circle_y + 6), fill="#FF5F56")
-                        # Yellow circle
-                        draw.ellipse((35, circle_y - 6, 35 + 12, circle_y + 6), fill="#FFBD2E")
-                        # Green circle
-                        draw.ellipse((55, circle_y - 6, 55 + 12, circle_y + 6), fill="#27C93F")
-                    
-                    # Draw title text (centered)
-                    text_width = title_font.getlength(title) if hasattr(title_font, 'getlength') else draw.textlength(title, font=title_font)
-                    text_x = (width - text_width) // 2
-                    draw.text((text_x, 5), title, font=title_font, fill="#FFFFFF")
-                
-                # Add drop shadow effect
-                shadow = Image.new('RGBA', (width + 20, new_height + 20), (0, 0, 0, 0))
-                shadow_draw = ImageDraw.Draw(shadow)
-                shadow_rect = [(10, 10), (width + 10, new_height + 10)]
-                shadow_draw.rectangle(shadow_rect, fill=(0, 0, 0, 20))
-                shadow = shadow.filter(ImageFilter.GaussianBlur(10))
-                
-                # Create the final image with shadow
-                final_image = Image.new('RGBA', shadow.size, (0, 0, 0, 0))
-                final_image.paste(shadow, (0, 0))
-                final_image.paste(new_img, (10, 10), new_img)
-                
-                # Save with transparency
-                final_image.save(image_path)
-                
-                self.app.status_var.set(f"Saved: {image_path}")
-                return True
-            else:
-                self.app.status_var.set("No project opened. Please open or create a project first.")
-                return False
-                
-        except Exception as e:
-            self.app.status_var.set(f"Error exporting image: {str(e)}")
-            import traceback
-            traceback.print_exc()  # Print detailed error for debugging
+        # Determine the folder to save in
+        if folder is None and self.app.project_path:
+            folder = project.images_folder(self.app.project_path)
+        
+        if folder:
+            # Rendered on a worker thread so the window stays responsive
+            return self.app.start_export([data], folder, include_circles, single=True)
+        else:
+            self.app.status_var.set("No project opened. Please open or create a project first.")
             return False
     
     def copy_to_clipboard(self):
-        code = self.text.get("1.0", tk.END).strip()
+        code = self.get_data().code
         if code:
+            import pyperclip
             pyperclip.copy(code)
             self.app.status_var.set("Code copied to clipboard")
         else:
             self.app.status_var.set("Nothing to copy - code cell is empty")
 
     def remove_cell(self):
-        if len(self.app.cells) > 1:
-            self.app.cells.remove(self)
-            self.frame.destroy()
-            self.app.canvas.configure(scrollregion=self.app.canvas.bbox("all"))
-            self.app.status_var.set("Cell removed")
-        else:
-            self.app.status_var.set("Cannot remove the last cell")
+        self.app.remove_cell(self.index)
+
+def warm_up():
+    """Import the render stack and load its fonts and lexers off the main thread"""
+    try:
+        for name in WARM_UP_MODULES:
+            importlib.import_module(name)
+        import renderer
+        renderer.warm_up()
+    except Exception:
+        traceback.print_exc()
+    if os.environ.get(STARTUP_TIME_ENV):
+        print(f"Render stack warm after {time.perf_counter() - STARTED:.3f} s", file=sys.stderr)
+
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        import cli
+        sys.exit(cli.main())
+
     root = tk.Tk()
     app = CodeEditorApp(root)
+    if os.environ.get(STARTUP_TIME_ENV):
+        root.after_idle(lambda: print(f"First frame after {app.startup_time:.3f} s", file=sys.stderr))
     root.mainloop()
\ No newline at end of file
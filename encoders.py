@@ -0,0 +1,231 @@
+import struct
+import zlib
+
+# PIL is imported inside the functions that encode, so the GUI can list the
+# formats at startup without loading it
+
+# Output formats and the file extension each one is saved with
+FORMATS = {
+    "png": ".png",
+    "png-palette": ".png",   # quantized to a palette; code images use few colors
+    "webp": ".webp",         # lossless
+    "svg": ".svg",           # vector text through Pygments' SvgFormatter
+}
+
+DEFAULT_SETTINGS = {
+    "format": "png",
+    "compress_level": 6,     # zlib level for PNG, 0-9
+    "optimize": False,       # extra PNG compression passes
+    "colors": 256,           # palette size for png-palette
+    "webp_method": 4,        # WebP effort, 0 (fast) to 6 (small)
+}
+
+# Largest width/height a WebP image can have
+WEBP_MAX_SIZE = 16383
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG scanline filter type "Up": each byte minus the byte above it
+FILTER_UP = b"\x02"
+
+# Rows of a PDF page filtered and compressed at a time
+PDF_BAND_HEIGHT = 256
+
+
+def output_settings(settings=None):
+    """``settings`` filled in with the defaults; raises ValueError for bad values"""
+    merged = dict(DEFAULT_SETTINGS)
+    if settings:
+        merged.update((key, value) for key, value in settings.items() if value is not None)
+    if not isinstance(merged["format"], str) or merged["format"] not in FORMATS:
+        raise ValueError(f"Unknown output format: {merged['format']} (expected one of {', '.join(FORMATS)})")
+    for key in ("compress_level", "colors", "webp_method"):
+        if isinstance(merged[key], bool) or not isinstance(merged[key], int):
+            raise ValueError(f"'{key}' must be a whole number")
+    if not 0 <= merged["compress_level"] <= 9:
+        raise ValueError("PNG compression level must be between 0 and 9")
+    if not 2 <= merged["colors"] <= 256:
+        raise ValueError("Palette size must be between 2 and 256 colors")
+    if not 0 <= merged["webp_method"] <= 6:
+        raise ValueError("WebP method must be between 0 and 6")
+    return merged
+
+
+def extension(settings=None):
+    return FORMATS[output_settings(settings)["format"]]
+
+
+def streams(settings):
+    """True if images in this format can be written strip by strip"""
+    return settings["format"] == "png"
+
+
+def save_image(image, path, settings):
+    """Encode a finished RGBA image to ``path`` in a raster format from ``settings``"""
+    from PIL import Image
+
+    image_format = settings["format"]
+    if image_format == "png":
+        image.save(path, "PNG", compress_level=settings["compress_level"], optimize=settings["optimize"])
+    elif image_format == "png-palette":
+        palette_image = image.quantize(settings["colors"], method=Image.Quantize.FASTOCTREE)
+        palette_image.save(path, "PNG", compress_level=settings["compress_level"], optimize=settings["optimize"])
+    elif image_format == "webp":
+        if max(image.size) > WEBP_MAX_SIZE:
+            raise ValueError(f"Image is too large for WebP ({image.size[0]}x{image.size[1]}); split it into pages")
+        image.save(path, "WEBP", lossless=True, method=settings["webp_method"])
+    else:
+        raise ValueError(f"Cannot save a raster image as {image_format}")
+
+
+def filter_up(image, previous_row=None):
+    """
+    PNG scanlines of ``image`` with the Up filter: each row prefixed by its
+    filter type and minus the row above it (``previous_row`` for the first
+    one, or zeros). Computed for the whole image at once.
+    """
+    from PIL import Image, ImageChops
+
+    width, rows = image.size
+    # Subtract the image shifted down a row
+    above = Image.new(image.mode, (width, rows))
+    if previous_row is not None:
+        above.paste(previous_row, (0, 0))
+    if rows > 1:
+        above.paste(image.crop((0, 0, width, rows - 1)), (0, 1))
+    filtered = ImageChops.subtract_modulo(image, above).tobytes()
+
+    stride = len(filtered) // rows
+    return b"".join(FILTER_UP + filtered[y * stride:(y + 1) * stride] for y in range(rows))
+
+
+def png_chunk(chunk_type, data):
+    return (
+        struct.pack(">I", len(data)) + chunk_type + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+    )
+
+
+class StreamingPNGWriter:
+    """
+    Writes an RGBA PNG one horizontal strip at a time, so an image never has
+    to be held in memory (or even exist) as a whole. Strips must be written
+    top to bottom and add up to the declared height.
+    """
+
+    def __init__(self, fileobj, width, height, compress_level=6):
+        from PIL import Image
+
+        self.fileobj = fileobj
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.compressor = zlib.compressobj(compress_level)
+        self.previous_row = Image.new('RGBA', (width, 1), (0, 0, 0, 0))
+
+        fileobj.write(PNG_SIGNATURE)
+        # 8 bits per channel, color type 6 (RGBA), no interlacing
+        fileobj.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+
+    def write_strip(self, strip):
+        if strip.mode != 'RGBA':
+            strip = strip.convert('RGBA')
+        data = self.compressor.compress(filter_up(strip, self.previous_row))
+        self.previous_row = strip.crop((0, strip.size[1] - 1, strip.size[0], strip.size[1]))
+        if data:
+            self.fileobj.write(png_chunk(b"IDAT", data))
+        self.rows_written += strip.size[1]
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"Wrote {self.rows_written} rows of a {self.height} row PNG")
+        self.fileobj.write(png_chunk(b"IDAT", self.compressor.flush()))
+        self.fileobj.write(png_chunk(b"IEND", b""))
+
+
+def write_png_strips(path, size, strips, compress_level=6):
+    """Encode an iterable of RGBA strips, top to bottom, into a PNG at ``path``"""
+    with open(path, "wb") as f:
+        writer = StreamingPNGWriter(f, *size, compress_level)
+        for strip in strips:
+            writer.write_strip(strip)
+        writer.close()
+
+
+class StreamingPDFWriter:
+    """
+    Writes a PDF with one full-page image per page, a page at a time, so only
+    the page being added is ever held in memory. Pages are Flate-compressed
+    RGB with the PNG Up predictor. Page sizes may differ; ``dpi`` sets how
+    large a pixel is on paper.
+    """
+
+    def __init__(self, fileobj, dpi=96, compress_level=6):
+        self.fileobj = fileobj
+        self.dpi = dpi
+        self.compress_level = compress_level
+        self.offsets = {}  # object number -> byte offset
+        self.pages = []    # object numbers of the page objects
+        self.next_object = 3  # 1 is the catalog, 2 the page tree (written last)
+        self.position = 0
+
+        self.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.position += len(data)
+
+    def write_object(self, number, body, stream=None):
+        self.offsets[number] = self.position
+        self.write(b"%d 0 obj\n" % number + body)
+        if stream is not None:
+            self.write(b"\nstream\n" + stream + b"\nendstream")
+        self.write(b"\nendobj\n")
+
+    def add_page(self, image):
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        width, height = image.size
+        # Filtered and compressed in bands so the page's raw bytes are never all copied at once
+        compressor = zlib.compressobj(self.compress_level)
+        parts = []
+        previous_row = None
+        for top in range(0, height, PDF_BAND_HEIGHT):
+            band = image.crop((0, top, width, min(top + PDF_BAND_HEIGHT, height)))
+            parts.append(compressor.compress(filter_up(band, previous_row)))
+            previous_row = band.crop((0, band.size[1] - 1, width, band.size[1]))
+        parts.append(compressor.flush())
+        data = b"".join(parts)
+        image_number, content_number, page_number = range(self.next_object, self.next_object + 3)
+        self.next_object += 3
+
+        self.write_object(image_number, (
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+            b"/BitsPerComponent 8 /Filter /FlateDecode "
+            b"/DecodeParms << /Predictor 12 /Colors 3 /BitsPerComponent 8 /Columns %d >> /Length %d >>"
+            % (width, height, width, len(data))
+        ), data)
+        # Page size in points (1/72 inch)
+        page_width, page_height = width * 72 / self.dpi, height * 72 / self.dpi
+        content = b"q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q" % (page_width, page_height)
+        self.write_object(content_number, b"<< /Length %d >>" % len(content), content)
+        self.write_object(page_number, (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+            b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+            % (page_width, page_height, image_number, content_number)
+        ))
+        self.pages.append(page_number)
+
+    def close(self):
+        if not self.pages:
+            raise ValueError("A PDF needs at least one page")
+        kids = b" ".join(b"%d 0 R" % number for number in self.pages)
+        self.write_object(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.pages)))
+
+        xref = self.position
+        count = self.next_object
+        lines = [b"xref\n0 %d\n" % count, b"0000000000 65535 f \n"]
+        lines.extend(b"%010d 00000 n \n" % self.offsets[number] for number in range(1, count))
+        self.write(b"".join(lines))
+        self.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref))
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import encoders
+import renderer
+import render_cache
+
+
+# Kept alive between exports so workers keep their warm lexer/formatter/font caches
+_pool = None
+_pool_workers = 0
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def warm_up_worker():
+    # A failed warm-up (e.g. no font) must not kill the worker: the cells it
+    # renders then report the real error themselves
+    try:
+        renderer.warm_up()
+    except Exception:
+        traceback.print_exc()
+
+
+def get_pool(workers):
+    """Return the shared render pool, (re)starting it if the worker count changed"""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_up_worker)
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        _pool_workers = 0
+
+
+def export_cell(job):
+    """Export one cell in a worker process; returns (image paths, error message, stats)"""
+    cell, folder, include_circles, options = job
+    start = time.perf_counter()
+    stats = {}
+    try:
+        image_paths = renderer.export_image(
+            cell.code, cell.language, cell.title, folder, include_circles, stats=stats, **options
+        )
+        error = None
+    except Exception as e:
+        image_paths, error = None, str(e) or e.__class__.__name__
+    stats["wall"] = time.perf_counter() - start
+    return image_paths, error, stats
+
+
+def export_chunk(jobs):
+    return [export_cell(job) for job in jobs]
+
+
+def export_cells(cells, folder, workers=None, include_circles=False, cache=None,
+                 progress=None, cancel=None, options=None, stats=None):
+    """
+    Render ``cells`` (``project.Cell`` objects) into ``folder``.
+
+    Cells are spread over a process pool of ``workers`` processes (default: one
+    per core). Returns a list of ``(index, image_paths, error)`` tuples in the
+    same order as ``cells``, with one path per page; empty cells are skipped
+    and not reported. ``options`` are passed on to ``renderer.export_image``
+    (e.g. ``max_lines`` / ``max_height`` for pagination, ``output`` for the
+    encoder settings, ``scales`` for high-DPI copies).
+
+    With a ``render_cache.RenderCache``, cells whose image is already current
+    are skipped and previously rendered images are restored from the cache, so
+    only changed cells reach the pool.
+
+    ``progress(index, image_paths, error)`` is called as each cell finishes, and
+    setting the ``cancel`` event stops the export early; cells that never ran
+    are left out of the result.
+
+    If a ``stats`` dict is given, it is filled with a ``cell_stats`` record
+    per exported cell index: wall time, time per stage, and the size and bytes
+    written of each image.
+    """
+    workers = max(1, workers or default_workers())
+    # Fill in the encoder defaults so equivalent settings share cache entries
+    options = dict(options or {})
+    options["output"] = encoders.output_settings(options.get("output"))
+    options["scales"] = renderer.scale_factors(options.get("scales"))
+    if options["scales"] == [1]:
+        del options["scales"]  # The default; keep the cache keys of 1x-only exports unchanged
+    extension = encoders.FORMATS[options["output"]["format"]]
+    os.makedirs(folder, exist_ok=True)
+
+    results = {}
+    pending = []
+    keys = {}
+
+    def finish(index, image_paths, error, cell_record=None):
+        results[index] = (index, image_paths, error)
+        cell_record = cell_record or {}
+        if index in keys and not error:
+            key, image_path = keys[index]
+            start = time.perf_counter()
+            cache.store(key, image_path, image_paths)
+            cell_record.setdefault("stages", {})["cache"] = time.perf_counter() - start
+        if stats is not None:
+            stats[index] = cell_stats(cells[index], cell_record, error)
+        if progress:
+            progress(index, image_paths, error)
+
+    for index, cell in enumerate(cells):
+        if not cell.code.strip():
+            continue
+        if cache is not None:
+            start = time.perf_counter()
+            key = render_cache.cell_key(cell, include_circles, options=options)
+            image_path = renderer.image_path_for(folder, cell.title.strip(), extension)
+            if cache.is_current(image_path, key):
+                image_paths = cache.current_paths(image_path)
+            else:
+                image_paths = cache.restore(key, image_path)
+            if image_paths:
+                cache.hits += 1
+                seconds = time.perf_counter() - start
+                pages = [{"path": path, "size": None, "bytes": os.path.getsize(path)} for path in image_paths]
+                record = {"cached": True, "wall": seconds, "stages": {"cache": seconds}, "pages": pages}
+                finish(index, image_paths, None, record)
+                continue
+            cache.misses += 1
+            keys[index] = (key, image_path)
+        pending.append(index)
+
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    if workers == 1 or len(pending) <= 1:
+        # Not worth starting a pool for a single cell
+        for index in pending:
+            if cancelled():
+                break
+            finish(index, *export_cell((cells[index], folder, include_circles, options)))
+    else:
+        # Hand out several cells per task so small snippets don't drown in IPC overhead
+        chunksize = max(1, len(pending) // (workers * 4))
+        pool = get_pool(workers)
+        chunks = {}
+        for start in range(0, len(pending), chunksize):
+            chunk = pending[start:start + chunksize]
+            jobs = [(cells[index], folder, include_circles, options) for index in chunk]
+            chunks[pool.submit(export_chunk, jobs)] = chunk
+
+        not_done = set(chunks)
+        broken = False
+        try:
+            while not_done and not cancelled():
+                done, not_done = wait(not_done, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        outcomes = future.result()
+                    except Exception as e:
+                        # A worker died (e.g. out of memory); fail its cells, keep the rest
+                        broken = True
+                        outcomes = [(None, f"Render process failed: {e}", None)] * len(chunks[future])
+                    for index, outcome in zip(chunks[future], outcomes):
+                        finish(index, *outcome)
+        finally:
+            for future in not_done:
+                future.cancel()
+            if broken:
+                # Start a fresh pool next time instead of reusing the broken one
+                shutdown_pool()
+
+    if cache is not None:
+        cache.save()
+    return [results[index] for index in sorted(results)]
+
+
+def cell_stats(cell, record, error=None):
+    """A JSON-ready stats record for one exported cell"""
+    return {
+        "title": cell.title.strip() or "untitled",
+        "language": cell.language,
+        "lines": cell.code.strip().count("\n") + 1,
+        "cached": record.get("cached", False),
+        "error": error,
+        "wall": record.get("wall", 0.0),
+        "stages": record.get("stages", {}),
+        "pages": record.get("pages", []),
+    }
+
+
+def write_trace(path, stats, **meta):
+    """Save per-cell export stats as a JSON trace, slowest cells first"""
+    records = [dict(record, index=index) for index, record in stats.items()]
+    records.sort(key=lambda record: record["wall"], reverse=True)
+    trace = dict(meta, created=time.strftime("%Y-%m-%dT%H:%M:%S"), cells=records)
+    with open(path, "w") as f:
+        json.dump(trace, f, indent=4)
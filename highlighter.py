@@ -0,0 +1,309 @@
+import bisect
+import functools
+
+try:
+    from re import _compiler as sre_compile, _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_compile
+    import sre_constants
+    import sre_parse
+
+from pygments.lexer import RegexLexer
+from pygments.lexers import get_lexer_by_name
+from pygments.styles import get_style_by_name
+from pygments.token import Error, Whitespace, _TokenType
+
+# Same Pygments style the exported images use
+EDITOR_STYLE = "default"
+
+
+@functools.lru_cache(maxsize=None)
+def token_color(style_name, ttype):
+    """Foreground color ('#rrggbb') a Pygments style uses for ``ttype``, or None"""
+    color = get_style_by_name(style_name).style_for_token(ttype)["color"]
+    return f"#{color}" if color else None
+
+
+# Characters a repeated part of a rule is tried on to see whether it can run
+# on past the end of a line over arbitrary text (e.g. ``[\w\W]*?`` in a block
+# comment), unlike whitespace runs
+SPAN_PROBES = "\n", "ax*/\"'#<>{}0"
+REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+
+
+def can_span(items, state):
+    """True if the parsed regex ``items`` contain a repeat that can match newlines and other text"""
+    for op, av in items:
+        if op in REPEATS:
+            body = av[2]
+            if av[1] > 1 and matches_probes(body, state):
+                return True
+            if can_span(body, state):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if can_span(av[-1], state):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(can_span(branch, state) for branch in av[1]):
+                return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if can_span(av[1], state):
+                return True
+    return False
+
+
+def matches_probes(items, state):
+    newline, others = SPAN_PROBES
+    body = compile_items(items, state)
+    return bool(body.match(newline)) and any(body.match(char) for char in others)
+
+
+def compile_items(items, state):
+    # ``state`` carries the flags (e.g. DOTALL) the items were parsed with
+    return sre_compile.compile(sre_parse.SubPattern(state, list(items)), 0)
+
+
+def opener_items(items, state):
+    """
+    The leading part of a spanning rule: up to and including one step of the
+    repeat that can span lines. It descends into groups, so ``("[^"]*")``
+    gives ``"[^"]``, and ``[^"]+`` (which fails without reading past the
+    character it fails on) gives ``[^"]``.
+    """
+    for index, (op, av) in enumerate(items):
+        if op is sre_constants.SUBPATTERN and can_span(av[-1], state):
+            return list(items[:index]) + opener_items(av[-1], state)
+        if op in REPEATS and av[1] > 1 and matches_probes(av[2], state):
+            return list(items[:index]) + list(av[2])
+        if can_span([(op, av)], state):
+            return list(items[:index])
+    return list(items)
+
+
+@functools.lru_cache(maxsize=None)
+def rule_opener(pattern, flags):
+    """
+    For a lexer rule that can match across lines over arbitrary text, a
+    ``match`` function for its leading part; None for other rules. Where a
+    spanning rule fails but its opener matches (an unterminated block comment
+    or string), whether it matches depends on text further down the buffer.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+        if not can_span(parsed.data, parsed.state):
+            return None
+        return compile_items(opener_items(parsed.data, parsed.state), parsed.state).match
+    except Exception:
+        # Anything unexpected counts as spanning, with an opener that always matches
+        return lambda text, pos=0: True
+
+
+class IncrementalHighlighter:
+    """
+    Keeps the Pygments token stream of an editor buffer up to date.
+
+    After an edit, lexing restarts from the nearest line before the change
+    where the lexer was in a known state at a token boundary (a checkpoint),
+    and stops as soon as it reaches an unchanged line whose checkpoint matches
+    the previous run, since everything after it would lex the same way.
+
+    A line start only becomes a checkpoint if no rule tried before it could
+    still match across it: once a rule that spans lines in one match (e.g. a
+    ``/* ... */`` comment regex) fails at an opener like ``/*``, its outcome
+    depends on text anywhere below, so the lines after it get no checkpoints
+    until the lexer moves past it, and later edits restart before the opener.
+
+    This needs to drive the lexer's state machine directly, so it only works
+    for plain RegexLexers; lexers that post-process their token stream are
+    re-lexed in full, but still only report the lines whose tokens changed.
+    """
+
+    def __init__(self, language):
+        self.language = language
+        self.lexer = get_lexer_by_name(language)
+        self.incremental = (
+            isinstance(self.lexer, RegexLexer)
+            and type(self.lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed
+        )
+        self.lines = [""]
+        self.line_tokens = [[]]           # per line: [(start column, end column, token type)]
+        self.checkpoints = [("root",)]    # per line: lexer stack at its start, or None
+        self._openers = None
+
+    def update(self, text):
+        """
+        Re-lex after the buffer changed to ``text``. Returns ``(first, last)``,
+        the range of lines (0-based, ``last`` exclusive) whose tokens must be
+        redrawn, or None if nothing changed.
+        """
+        new_lines = text.split("\n")
+        old_lines = self.lines
+
+        # Common prefix and suffix of unchanged lines
+        limit = min(len(old_lines), len(new_lines))
+        prefix = 0
+        while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+            prefix += 1
+        if prefix == len(old_lines) == len(new_lines):
+            return None
+        suffix = 0
+        while (suffix < limit - prefix
+               and old_lines[-1 - suffix] == new_lines[-1 - suffix]):
+            suffix += 1
+
+        if self.incremental:
+            return self.relex(text, new_lines, prefix, suffix)
+        return self.relex_all(text, new_lines, prefix, suffix)
+
+    def relex(self, text, new_lines, prefix, suffix):
+        old_count, new_count = len(self.lines), len(new_lines)
+        shift = new_count - old_count
+        unchanged_from = new_count - suffix  # first new line of the unchanged tail
+
+        # Restart one line before the edit (lookahead may reach into it), at
+        # the nearest line that began on a token boundary
+        start = min(max(prefix - 1, 0), len(self.checkpoints) - 1)
+        while self.checkpoints[start] is None:
+            start -= 1
+        stack = list(self.checkpoints[start])
+
+        line_starts = [0]
+        for line in new_lines[:-1]:
+            line_starts.append(line_starts[-1] + len(line) + 1)
+
+        tokens = [[] for _ in range(new_count - start)]
+        checkpoints = [None] * (new_count - start)
+        checkpoints[0] = tuple(stack)
+        stop = new_count
+
+        pos = line_starts[start]
+        tokendefs = self.lexer._tokens
+        statetokens = tokendefs[stack[-1]]
+        openers = self.openers()
+        open_construct = False  # a spanning rule failed at an opener: no more checkpoints
+        next_line = start + 1
+
+        def add_token(token_pos, ttype, value):
+            # Split a token into per-line column ranges
+            line = bisect.bisect_right(line_starts, token_pos) - 1
+            column = token_pos - line_starts[line]
+            for index, part in enumerate(value.split("\n")):
+                if index:
+                    line += 1
+                    column = 0
+                if part:
+                    tokens[line - start].append((column, column + len(part), ttype))
+                    column += len(part)
+
+        while pos < len(text):
+            for rexmatch, action, new_state in statetokens:
+                m = rexmatch(text, pos)
+                if not m and not open_construct and openers.get(rexmatch):
+                    open_construct = bool(openers[rexmatch](text, pos))
+                if m:
+                    if action is not None:
+                        if type(action) is _TokenType:
+                            add_token(pos, action, m.group())
+                        else:
+                            for token_pos, ttype, value in action(self.lexer, m):
+                                add_token(token_pos, ttype, value)
+                    pos = m.end()
+                    if new_state is not None:
+                        apply_state(stack, new_state)
+                        statetokens = tokendefs[stack[-1]]
+                    break
+            else:
+                if text[pos] == "\n":
+                    # At EOL with no match, RegexLexer resets to "root"
+                    stack = ["root"]
+                    statetokens = tokendefs["root"]
+                    add_token(pos, Whitespace, "\n")
+                else:
+                    add_token(pos, Error, text[pos])
+                pos += 1
+
+            # Record the state of every line start we land on exactly
+            while next_line < new_count and line_starts[next_line] < pos:
+                next_line += 1
+            if next_line < new_count and line_starts[next_line] == pos and not open_construct:
+                state = tuple(stack)
+                checkpoints[next_line - start] = state
+                if next_line >= unchanged_from and next_line > prefix:
+                    # Back in unchanged text in the same state as last time:
+                    # the rest of the old tokens are still valid
+                    if self.checkpoints[next_line - shift] == state:
+                        stop = next_line
+                        break
+                next_line += 1
+
+        self.line_tokens = (
+            self.line_tokens[:start] + tokens[:stop - start] + self.line_tokens[stop - shift:]
+        )
+        self.checkpoints = (
+            self.checkpoints[:start] + checkpoints[:stop - start] + self.checkpoints[stop - shift:]
+        )
+        self.lines = new_lines
+        return start, stop
+
+    def openers(self):
+        """Opener ``match`` functions of the lexer's spanning rules, by the rules' own ``match``"""
+        if self._openers is None:
+            self._openers = {}
+            for rules in self.lexer._tokens.values():
+                for rexmatch, _, _ in rules:
+                    regex = rexmatch.__self__
+                    opener = rule_opener(regex.pattern, regex.flags)
+                    if opener is not None:
+                        self._openers[rexmatch] = opener
+        return self._openers
+
+    def relex_all(self, text, new_lines, prefix, suffix):
+        line_tokens = [[] for _ in new_lines]
+        line = column = 0
+        for _, ttype, value in self.lexer.get_tokens_unprocessed(text):
+            for index, part in enumerate(value.split("\n")):
+                if index:
+                    line += 1
+                    column = 0
+                if part:
+                    line_tokens[line].append((column, column + len(part), ttype))
+                    column += len(part)
+
+        # Only report the edited lines and the lines whose tokens differ
+        old_tokens = self.line_tokens
+        first = 0
+        limit = min(len(old_tokens), len(line_tokens), prefix)
+        while first < limit and old_tokens[first] == line_tokens[first]:
+            first += 1
+        last = len(line_tokens)
+        old_last = len(old_tokens)
+        while (last > max(first, len(new_lines) - suffix) and old_last > first
+               and old_tokens[old_last - 1] == line_tokens[last - 1]):
+            last -= 1
+            old_last -= 1
+
+        self.line_tokens = line_tokens
+        self.checkpoints = [("root",)] + [None] * (len(new_lines) - 1)
+        self.lines = new_lines
+        return first, last
+
+
+def apply_state(stack, new_state):
+    """Apply a RegexLexer state transition to ``stack`` in place"""
+    if isinstance(new_state, tuple):
+        for state in new_state:
+            if state == "#pop":
+                if len(stack) > 1:
+                    stack.pop()
+            elif state == "#push":
+                stack.append(stack[-1])
+            else:
+                stack.append(state)
+    elif isinstance(new_state, int):
+        # pop, but keep at least one state on the stack
+        if abs(new_state) >= len(stack):
+            del stack[1:]
+        else:
+            del stack[new_state:]
+    elif new_state == "#push":
+        stack.append(stack[-1])
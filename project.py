@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import hashlib
+
+PROJECT_FILE = "file.imgnb"
+IMAGES_FOLDER = "images"
+JOURNAL_SUFFIX = ".journal"
+
+# Languages offered for cells (Pygments lexer names)
+LANGUAGES = [
+    "python", "matlab", "bash", "java", "javascript", "html",
+    "css", "c", "cpp", "csharp", "php", "ruby", "swift",
+    "kotlin", "go", "rust", "r", "sql", "powershell",
+]
+
+# Fold the journal back into file.imgnb once it grows past this size
+COMPACT_BYTES = 1024 * 1024
+
+
+def project_file(project_dir):
+    return os.path.join(project_dir, PROJECT_FILE)
+
+
+def journal_file(project_dir):
+    return project_file(project_dir) + JOURNAL_SUFFIX
+
+
+def images_folder(project_dir):
+    return os.path.join(project_dir, IMAGES_FOLDER)
+
+
+class Cell:
+    """
+    One snippet of a project, as plain data: the title, the Pygments language
+    name, the code and optionally the ``source`` file it is linked to (see
+    watch.py). Cells are the source of truth; the GUI's editor widgets are only
+    views bound to them, so saving, exporting and searching never touch Tk.
+
+    ``content_hash`` identifies what the cell renders to. It is computed on
+    first use and cached until the title, language or code changes.
+    """
+
+    __slots__ = ("title", "language", "code", "source", "_hash")
+
+    def __init__(self, title="", language="python", code="", source=None):
+        self.title = title
+        self.language = language
+        self.code = code
+        self.source = source
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name != "_hash":
+            object.__setattr__(self, "_hash", None)
+
+    def __repr__(self):
+        return f"Cell({self.title!r}, {self.language!r}, <{len(self.code)} chars>)"
+
+    @property
+    def content_hash(self):
+        if self._hash is None:
+            data = json.dumps([self.title.strip(), self.language, self.code.strip()]).encode("utf-8")
+            self._hash = hashlib.sha256(data).hexdigest()
+        return self._hash
+
+    @classmethod
+    def from_dict(cls, cell_data):
+        return cls(
+            cell_data.get("title", ""),
+            cell_data.get("language", "python"),
+            cell_data.get("code", ""),
+            cell_data.get("source") or None,
+        )
+
+    def to_dict(self):
+        """The cell as saved to file.imgnb"""
+        cell_data = {"title": self.title, "language": self.language, "code": self.code}
+        if self.source:
+            cell_data["source"] = self.source
+        return cell_data
+
+    def copy(self, **changes):
+        cell = Cell(self.title, self.language, self.code, self.source)
+        for name, value in changes.items():
+            setattr(cell, name, value)
+        return cell
+
+
+def file_hash(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def write_atomic(path, text):
+    """Write ``text`` to a temp file next to ``path`` and rename it into place"""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def backup_corrupted(project_dir):
+    """Move an unreadable project file aside instead of overwriting it; returns the new path"""
+    backup_path = project_file(project_dir) + time.strftime(".corrupt-%Y%m%d-%H%M%S")
+    os.replace(project_file(project_dir), backup_path)
+    return backup_path
+
+
+def load_project(project_dir):
+    """
+    Read the cells and settings of a project, replaying any autosave journal
+    on top of file.imgnb. Returns ``(cells, settings)``. Raises
+    json.JSONDecodeError if file.imgnb itself is corrupted.
+    """
+    file_path = project_file(project_dir)
+    if not os.path.exists(file_path):
+        return [], {}
+    with open(file_path, "r") as f:
+        data = json.load(f)
+    cells = [Cell.from_dict(cell_data) for cell_data in data.get("cells", [])]
+    settings = dict(data.get("settings", {}))
+    replay_journal(project_dir, cells, settings)
+    return cells, settings
+
+
+def load_cells(project_dir):
+    return load_project(project_dir)[0]
+
+
+def load_settings(project_dir):
+    """Project-wide export settings (e.g. the output format), possibly empty"""
+    return load_project(project_dir)[1]
+
+
+def save_cells(project_dir, cells, settings=None):
+    """
+    Atomically rewrite file.imgnb with ``cells`` (Cell objects) and drop the
+    journal it supersedes. The saved settings are kept unless new ``settings``
+    are given.
+    """
+    if settings is None:
+        settings = load_settings(project_dir) if os.path.exists(project_file(project_dir)) else {}
+    data = {"cells": [cell.to_dict() for cell in cells]}
+    if settings:
+        data["settings"] = settings
+    write_atomic(project_file(project_dir), json.dumps(data, indent=4))
+    try:
+        os.remove(journal_file(project_dir))
+    except FileNotFoundError:
+        pass
+
+
+def apply_journal_entry(cells, entry, settings=None):
+    """Apply one journal entry; raises IndexError for an index outside ``cells``"""
+    op = entry["op"]
+    if op in ("set", "insert", "remove"):
+        # list.insert would clamp a bad index, putting the cell in the wrong place
+        last = len(cells) if op == "insert" else len(cells) - 1
+        if not 0 <= entry["index"] <= last:
+            raise IndexError(f"Journal index {entry['index']} is out of range for {len(cells)} cells")
+    if op == "set":
+        cells[entry["index"]] = Cell.from_dict(entry["cell"])
+    elif op == "insert":
+        cells.insert(entry["index"], Cell.from_dict(entry["cell"]))
+    elif op == "remove":
+        del cells[entry["index"]]
+    elif op == "settings" and settings is not None:
+        settings.clear()
+        settings.update(entry["settings"])
+
+
+def replay_journal(project_dir, cells, settings=None):
+    """Apply journaled edits to ``cells`` (and ``settings``) in place; returns the number applied"""
+    path = journal_file(project_dir)
+    if not os.path.exists(path):
+        return 0
+
+    with open(path, "r") as f:
+        lines = f.read().splitlines()
+    try:
+        header = json.loads(lines[0]) if lines else {}
+    except ValueError:
+        header = {}
+    if header.get("base") != file_hash(project_file(project_dir)):
+        # Written against another version of file.imgnb (e.g. a compaction
+        # finished but the old journal wasn't removed), so it no longer applies
+        os.remove(path)
+        return 0
+
+    applied = 0
+    for line in lines[1:]:
+        try:
+            apply_journal_entry(cells, json.loads(line), settings)
+        except (ValueError, KeyError, IndexError):
+            # A torn last line from a crash mid-append; everything before it is good
+            break
+        applied += 1
+    return applied
+
+
+class ProjectJournal:
+    """
+    Append-only log of cell edits next to file.imgnb.
+
+    Each line is one JSON operation (``set``, ``insert`` or ``remove`` by cell
+    index, or ``settings``), so autosaving only writes the cells that changed. The first line
+    records the hash of the file.imgnb it applies to; ``save_cells`` compacts
+    the journal back into the project file.
+    """
+
+    def __init__(self, project_dir):
+        self.project_dir = project_dir
+        self.path = journal_file(project_dir)
+
+    def append(self, entries):
+        if not entries:
+            return
+        lines = []
+        if not os.path.exists(self.path):
+            lines.append(json.dumps({"base": file_hash(project_file(self.project_dir))}))
+        lines.extend(json.dumps(entry) for entry in entries)
+        with open(self.path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def needs_compaction(self):
+        return self.size() > COMPACT_BYTES
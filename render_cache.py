@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+
+import renderer
+
+CACHE_FOLDER = ".imgnb_cache"
+MANIFEST_FILE = "manifest.json"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cell_key(cell, include_circles=False, formatter_options=None, options=None):
+    """Hash everything that affects the rendered image(s) of a ``project.Cell``"""
+    payload = {
+        "cell": cell.content_hash,
+        "render": renderer.render_signature(include_circles, formatter_options),
+        "options": options or {},
+    }
+    data = json.dumps(payload, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class RenderCache:
+    """
+    Content-addressed store of rendered images kept in ``<project>/.imgnb_cache``.
+
+    The manifest remembers which key produced each exported image (recorded
+    under the path of its first page, with the files of every page), so an
+    export can skip cells whose images on disk are already current, and
+    restore images from the store instead of re-rendering them. Stored images are evicted
+    least-recently-used first once they exceed ``max_bytes``.
+    """
+
+    def __init__(self, project_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = os.path.join(project_dir, CACHE_FOLDER)
+        self.max_bytes = max_bytes
+        self.entries = {}   # key -> {"size": bytes, "used": timestamp, "files": [page file names]}
+        self.outputs = {}   # image path -> {"key": key, "files": [{"path", "size", "mtime"}]}
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def manifest_path(self):
+        return os.path.join(self.folder, MANIFEST_FILE)
+
+    def blob_path(self, key, page=0):
+        return os.path.join(self.folder, f"{key}_{page}.png" if page else f"{key}.png")
+
+    def load(self):
+        try:
+            with open(self.manifest_path(), "r") as f:
+                data = json.load(f)
+            self.entries = data.get("entries", {})
+            self.outputs = data.get("outputs", {})
+        except (OSError, ValueError):
+            # A missing or damaged manifest only costs a re-render
+            self.entries = {}
+            self.outputs = {}
+
+    def save(self):
+        self.evict()
+        os.makedirs(self.folder, exist_ok=True)
+        temp_path = self.manifest_path() + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"entries": self.entries, "outputs": self.outputs}, f)
+        os.replace(temp_path, self.manifest_path())
+
+    def is_current(self, image_path, key):
+        """True if the images recorded for ``image_path`` exist and are exactly what ``key`` renders to"""
+        record = self.outputs.get(os.path.abspath(image_path))
+        if not record or record["key"] != key or not record.get("files"):
+            return False
+        for output in record["files"]:
+            try:
+                stat = os.stat(output["path"])
+            except OSError:
+                return False
+            if stat.st_size != output["size"] or stat.st_mtime != output["mtime"]:
+                return False
+        return True
+
+    def restore(self, key, image_path):
+        """
+        Copy the stored render of ``key`` next to ``image_path``; returns the
+        restored paths, or None on a miss.
+        """
+        entry = self.entries.get(key)
+        files = entry.get("files") if entry else None
+        if not files or not all(os.path.exists(self.blob_path(key, page)) for page in range(len(files))):
+            self.entries.pop(key, None)
+            return None
+        folder = os.path.dirname(image_path) or "."
+        os.makedirs(folder, exist_ok=True)
+        image_paths = []
+        for page, name in enumerate(files):
+            image_paths.append(os.path.join(folder, name))
+            shutil.copyfile(self.blob_path(key, page), image_paths[-1])
+        entry["used"] = time.time()
+        self.record_output(image_path, key, image_paths)
+        return image_paths
+
+    def current_paths(self, image_path):
+        record = self.outputs[os.path.abspath(image_path)]
+        return [output["path"] for output in record["files"]]
+
+    def store(self, key, image_path, image_paths):
+        """Remember that ``image_paths`` were rendered from ``key`` and keep a copy of them"""
+        os.makedirs(self.folder, exist_ok=True)
+        for page, path in enumerate(image_paths):
+            shutil.copyfile(path, self.blob_path(key, page))
+        self.entries[key] = {
+            "size": sum(os.path.getsize(path) for path in image_paths),
+            "used": time.time(),
+            "files": [os.path.basename(path) for path in image_paths],
+        }
+        self.record_output(image_path, key, image_paths)
+
+    def record_output(self, image_path, key, image_paths):
+        files = []
+        for path in image_paths:
+            stat = os.stat(path)
+            files.append({"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime})
+        self.outputs[os.path.abspath(image_path)] = {"key": key, "files": files}
+
+    def evict(self):
+        total = sum(entry["size"] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["used"]):
+            if total <= self.max_bytes:
+                break
+            entry = self.entries.pop(key)
+            total -= entry["size"]
+            for page in range(len(entry.get("files") or [None])):
+                try:
+                    os.remove(self.blob_path(key, page))
+                except OSError:
+                    pass
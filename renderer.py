@@ -0,0 +1,750 @@
+import io
+import os
+import time
+import bisect
+import functools
+import threading
+import contextlib
+from html import escape
+from pygments.lexers import get_lexer_by_name
+from pygments.formatters import ImageFormatter, SvgFormatter
+from PIL import Image, ImageDraw, ImageFont, ImageFilter
+
+import encoders
+
+# Custom formatter settings with Carbon.sh-inspired styling
+FORMATTER_OPTIONS = {
+    "font_name": "Consolas",
+    "font_size": 14,
+    "line_numbers": True,
+    "line_number_bg": "#DFE0E1",     # "#222831",  # Darker background for line numbers
+    "line_number_fg": "#606F85",     # Subtle color for line numbers
+    "line_number_bold": False,       # More subtle line numbers
+    "style": "default",              # "github-dark",    # Modern dark theme
+    "image_padding": 30,             # More generous padding
+    "image_bg": "#DFE0E1",           # Dark background (matches Carbon default)
+    "line_pad": 6,                   # Better line spacing
+    "line_number_separator": False,  # Remove the separator line
+}
+
+# Window chrome measurements (in pixels at 1x; see ``scaled``)
+TITLE_HEIGHT = 25
+TITLE_SIZE = 15
+TITLE_TOP = 5
+CORNER_RADIUS = 12
+SHADOW_OFFSET = 10
+SHADOW_BLUR = 10
+
+# Window controls: (left edge, color) of each circle, their diameter and center row
+CIRCLES = ((15, "#FF5F56"), (35, "#FFBD2E"), (55, "#27C93F"))
+CIRCLE_SIZE = 12
+CIRCLE_Y = 25
+
+# Formatter options measured in pixels, which grow with the scale factor
+# (ImageFormatter's own default for line_number_pad is 6)
+SCALED_OPTIONS = {"font_size": 14, "image_padding": 10, "line_pad": 2, "line_number_pad": 6}
+
+# Images taller than this are composited and encoded in horizontal strips of
+# STRIP_HEIGHT rows, so memory use doesn't grow with the length of the snippet
+STREAM_MIN_HEIGHT = 4000
+STRIP_HEIGHT = 256
+
+# Bump whenever a change to the pipeline alters the pixels it produces, so
+# cached renders from older versions are not reused
+RENDER_VERSION = 1
+
+
+def render_signature(include_circles=False, formatter_options=None):
+    """Every setting that changes the output image, for use in cache keys"""
+    options = dict(FORMATTER_OPTIONS)
+    if formatter_options:
+        options.update(formatter_options)
+    return {
+        "version": RENDER_VERSION,
+        "formatter": options,
+        "chrome": {
+            "title_height": TITLE_HEIGHT,
+            "title_size": TITLE_SIZE,
+            "corner_radius": CORNER_RADIUS,
+            "shadow_offset": SHADOW_OFFSET,
+            "shadow_blur": SHADOW_BLUR,
+            "include_circles": include_circles,
+        },
+    }
+
+
+def scaled(value, scale=1):
+    """A 1x pixel measurement at ``scale`` (e.g. 2 for Retina images)"""
+    return value if scale == 1 else int(round(value * scale))
+
+
+def scale_suffix(scale):
+    # "title@2x.png", the usual naming for high-DPI images; 1x keeps the plain name
+    return "" if scale == 1 else f"@{scale:g}x"
+
+
+def clean_filename(title):
+    # Create a clean filename from a cell title
+    return "".join(c if c.isalnum() or c in " -_" else "_" for c in title)
+
+
+def image_path_for(folder, title, extension=".png", scale=1):
+    return os.path.join(folder, f"{clean_filename(title or 'untitled')}{scale_suffix(scale)}{extension}")
+
+
+def page_path_for(folder, title, page, extension=".png", scale=1):
+    return os.path.join(folder, f"{clean_filename(title or 'untitled')}_{page}{scale_suffix(scale)}{extension}")
+
+
+class PILImageFormatter(ImageFormatter):
+    """
+    ImageFormatter that hands back the PIL image instead of encoding it, so the
+    compositing step gets pixels directly and the only encode is the final save.
+    """
+
+    def __init__(self, **options):
+        ImageFormatter.__init__(self, **options)
+        self.first_line_number = self.line_number_start
+
+    def layout(self, tokensource, line_number_start=None):
+        """Position every token without painting anything; returns the image size"""
+        # Drop the drawables left over from a previous render of this instance
+        self.drawables = []
+        self.sorted_drawables = None
+        self.line_number_start = line_number_start or self.first_line_number
+        self._create_drawables(tokensource)
+        self._draw_line_numbers()
+        return self._get_image_size(self.maxlinelength, self.maxlineno)
+
+    def paint(self, im, top=0):
+        """
+        Paint the laid out code onto ``im``. For strip rendering ``im`` holds
+        only the rows starting at ``top``, and only the tokens near them are drawn.
+        """
+        self._paint_line_number_bg(im)
+        draw = ImageDraw.Draw(im)
+        # Highlight
+        if self.hl_lines:
+            x = self.image_pad + self.line_number_width - self.line_number_pad + 1
+            recth = self._get_line_height()
+            rectw = im.size[0] - x
+            for linenumber in self.hl_lines:
+                y = self._get_line_y(linenumber - 1) - top
+                draw.rectangle([(x, y), (x + rectw, y + recth)], fill=self.hl_color)
+
+        drawables = self.drawables
+        if top or im.size[1] < self._get_image_size(self.maxlinelength, self.maxlineno)[1]:
+            if self.sorted_drawables is None:
+                self.sorted_drawables = sorted(self.drawables, key=lambda drawable: drawable[0][1])
+                self.drawable_rows = [drawable[0][1] for drawable in self.sorted_drawables]
+            # Glyphs hang below their line's top, so start a couple of lines early
+            reach = self._get_line_height() * 2
+            first = bisect.bisect_left(self.drawable_rows, top - reach)
+            last = bisect.bisect_left(self.drawable_rows, top + im.size[1])
+            drawables = self.sorted_drawables[first:last]
+
+        for pos, value, font, text_fg, text_bg in drawables:
+            pos = (pos[0], pos[1] - top)
+            if text_bg:
+                text_size = font.getbbox(value)[2:]
+                draw.rectangle([pos[0], pos[1], pos[0] + text_size[0], pos[1] + text_size[1]], fill=text_bg)
+            draw.text(pos, value, font=font, fill=text_fg)
+
+    def render(self, tokensource, line_number_start=None):
+        size = self.layout(tokensource, line_number_start)
+        im = Image.new('RGB', size, self.background_color)
+        self.paint(im)
+        return im
+
+    def format(self, tokensource, outfile):
+        self.render(tokensource).save(outfile, self.image_format.upper())
+
+
+# Lexers, formatters and fonts are expensive to set up (lexer lookup, system font
+# resolution) but cheap to reuse, so they are kept for the life of the process.
+# ImageFormatter keeps per-render state on the instance, hence the lock.
+_formatter_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_lexer(language):
+    return get_lexer_by_name(language, stripall=True)
+
+
+def formatter_key(formatter_options=None, scale=1):
+    options = dict(FORMATTER_OPTIONS)
+    if formatter_options:
+        options.update(formatter_options)
+    if scale != 1:
+        for name, default in SCALED_OPTIONS.items():
+            options[name] = scaled(int(options.get(name, default)), scale)
+    return tuple(sorted(options.items()))
+
+
+@functools.lru_cache(maxsize=32)
+def get_formatter(key):
+    return PILImageFormatter(**dict(key))
+
+
+@functools.lru_cache(maxsize=32)
+def get_font(name, size):
+    try:
+        return ImageFont.truetype(name, size)
+    except IOError:
+        # Cached, so the fallback is only reported once per process
+        print("Font not found")
+        return ImageFont.load_default()
+
+
+def warm_up(languages=("python",)):
+    """Load the default formatter, title font and some lexers ahead of the first render"""
+    get_formatter(formatter_key())
+    get_font("arial.ttf", TITLE_SIZE)
+    for language in languages:
+        get_lexer(language)
+
+
+def render_code(code, language, formatter_options=None, scale=1):
+    """Rasterize highlighted code into a PIL image (no window chrome)"""
+    lexer = get_lexer(language)
+    formatter = get_formatter(formatter_key(formatter_options, scale))
+
+    with _formatter_lock:
+        return formatter.render(lexer.get_tokens(code))
+
+
+# Size of the corner/edge pieces cut from the blurred shadow template. It has to
+# cover the shadow offset plus the full reach of the blur so that everything
+# past it is flat (see ``shadow_slice`` for larger shadows).
+SHADOW_SLICE = 64
+
+
+@functools.lru_cache(maxsize=8)
+def gradient_column(height):
+    """A 1px wide strip of the background gradient, stretched to width by the caller"""
+    # Gradient from #1F2430 to slightly lighter #262D3D
+    rows = bytearray()
+    for y in range(height):
+        rows += bytes((
+            int(31 + (y / height) * 7),
+            int(36 + (y / height) * 9),
+            int(48 + (y / height) * 13),
+        ))
+    return Image.frombytes('RGB', (1, height), bytes(rows))
+
+
+def gradient_background(width, height):
+    return gradient_column(height).resize((width, height), Image.NEAREST)
+
+
+@functools.lru_cache(maxsize=8)
+def corner_pieces(radius):
+    """Alpha masks for the (top left, top right, bottom left, bottom right) rounded corners"""
+    circle = Image.new('L', (radius * 2, radius * 2), 0)
+    draw = ImageDraw.Draw(circle)
+    draw.ellipse((0, 0, radius * 2, radius * 2), fill=255)
+    return (
+        circle.crop((0, 0, radius, radius)),
+        circle.crop((radius, 0, radius * 2, radius)),
+        circle.crop((0, radius, radius, radius * 2)),
+        circle.crop((radius, radius, radius * 2, radius * 2)),
+    )
+
+
+def rounded_mask(width, height, radius):
+    alpha = Image.new('L', (width, height), 255)
+    top_left, top_right, bottom_left, bottom_right = corner_pieces(radius)
+    alpha.paste(top_left, (0, 0))
+    alpha.paste(top_right, (width - radius, 0))
+    alpha.paste(bottom_left, (0, height - radius))
+    alpha.paste(bottom_right, (width - radius, height - radius))
+    return alpha
+
+
+def blurred_shadow(width, height, offset=SHADOW_OFFSET, blur=SHADOW_BLUR):
+    """Drop shadow for a ``width`` x ``height`` window, blurred from scratch"""
+    shadow = Image.new('RGBA', (width + offset * 2, height + offset * 2), (0, 0, 0, 0))
+    shadow_draw = ImageDraw.Draw(shadow)
+    shadow_rect = [(offset, offset), (width + offset, height + offset)]
+    shadow_draw.rectangle(shadow_rect, fill=(0, 0, 0, 20))
+    return shadow.filter(ImageFilter.GaussianBlur(blur))
+
+
+def shadow_slice(offset=SHADOW_OFFSET, blur=SHADOW_BLUR):
+    # A Gaussian blur reaches about three times its radius
+    return max(SHADOW_SLICE, (offset + blur) * 3)
+
+
+@functools.lru_cache(maxsize=4)
+def shadow_template(offset, blur):
+    s = shadow_slice(offset, blur)
+    return blurred_shadow(s * 2, s * 2, offset, blur)
+
+
+def drop_shadow(width, height, offset=SHADOW_OFFSET, blur=SHADOW_BLUR):
+    """
+    Drop shadow for a ``width`` x ``height`` window, 9-sliced from a small
+    blurred template: the corners are copied, the edges are stretched from a
+    single row/column and the flat middle is filled, so no blur runs per image.
+    """
+    s = shadow_slice(offset, blur)
+    shadow_width, shadow_height = width + offset * 2, height + offset * 2
+    if shadow_width <= s * 2 or shadow_height <= s * 2:
+        # Too small to slice; blurring it directly is cheap anyway
+        return blurred_shadow(width, height, offset, blur)
+
+    template = shadow_template(offset, blur)
+    tw, th = template.size
+    middle_width, middle_height = shadow_width - s * 2, shadow_height - s * 2
+
+    shadow = Image.new('RGBA', (shadow_width, shadow_height), template.getpixel((s, s)))
+    # Corners
+    shadow.paste(template.crop((0, 0, s, s)), (0, 0))
+    shadow.paste(template.crop((tw - s, 0, tw, s)), (shadow_width - s, 0))
+    shadow.paste(template.crop((0, th - s, s, th)), (0, shadow_height - s))
+    shadow.paste(template.crop((tw - s, th - s, tw, th)), (shadow_width - s, shadow_height - s))
+    # Edges
+    shadow.paste(template.crop((s, 0, s + 1, s)).resize((middle_width, s), Image.NEAREST), (s, 0))
+    shadow.paste(template.crop((s, th - s, s + 1, th)).resize((middle_width, s), Image.NEAREST), (s, shadow_height - s))
+    shadow.paste(template.crop((0, s, s, s + 1)).resize((s, middle_height), Image.NEAREST), (0, s))
+    shadow.paste(template.crop((tw - s, s, tw, s + 1)).resize((s, middle_height), Image.NEAREST), (shadow_width - s, s))
+    return shadow
+
+
+def draw_title(draw, width, title, include_circles=False, top=0, scale=1):
+    """Draw the title bar text (and window controls) with the window's row ``top`` at y=0"""
+    # Draw title text
+    title_font = get_font("arial.ttf", scaled(TITLE_SIZE, scale))
+
+    # # Add window controls (circles) for the macOS look
+    if include_circles:
+        circle_y = scaled(CIRCLE_Y, scale) - top
+        size = scaled(CIRCLE_SIZE, scale)
+        # Red, yellow and green circles
+        for left, color in CIRCLES:
+            x = scaled(left, scale)
+            draw.ellipse((x, circle_y - size // 2, x + size, circle_y + size // 2), fill=color)
+
+    # Draw title text (centered)
+    text_width = title_font.getlength(title) if hasattr(title_font, 'getlength') else draw.textlength(title, font=title_font)
+    text_x = (width - text_width) // 2
+    draw.text((text_x, scaled(TITLE_TOP, scale) - top), title, font=title_font, fill="#FFFFFF")
+
+
+def window_image(img, title="", include_circles=False, scale=1):
+    """The rounded gradient window with the code image and title bar on it, without the shadow"""
+    width, height = img.size
+
+    # Add extra space for title and add gradient background
+    title_height = scaled(TITLE_HEIGHT, scale)
+    new_height = height + title_height if title else height
+
+    # Gradient background with rounded corners
+    new_img = gradient_background(width, new_height)
+    new_img.putalpha(rounded_mask(width, new_height, scaled(CORNER_RADIUS, scale)))
+
+    # Paste the original image onto the new background
+    y_offset = title_height if title else 0
+    new_img.paste(img, (0, y_offset), img if img.mode == 'RGBA' else None)
+
+    # Add a window control UI element for that modern app look
+    if title:
+        draw_title(ImageDraw.Draw(new_img), width, title, include_circles, scale=scale)
+    return new_img
+
+
+def apply_chrome(img, title="", include_circles=False, scale=1):
+    """Wrap a rendered code image in the gradient window, title bar and drop shadow"""
+    new_img = window_image(img, title, include_circles, scale)
+
+    # Composite the window over its drop shadow
+    offset = scaled(SHADOW_OFFSET, scale)
+    final_image = drop_shadow(*new_img.size, offset, scaled(SHADOW_BLUR, scale))
+    final_image.paste(new_img, (offset, offset), new_img)
+    return final_image
+
+
+@functools.lru_cache(maxsize=4)
+def shadow_band(width, offset=SHADOW_OFFSET, blur=SHADOW_BLUR):
+    """
+    The drop shadow of a ``width`` wide window cut down to its top edge, one
+    row of its flat middle and its bottom edge, stacked. Every row of a taller
+    shadow of the same width is one of these rows.
+    """
+    return drop_shadow(width, shadow_slice(offset, blur) * 2 + 1 - offset * 2, offset, blur)
+
+
+def shadow_rows(width, height, top, bottom, offset=SHADOW_OFFSET, blur=SHADOW_BLUR):
+    """Rows ``top`` to ``bottom`` of the drop shadow for a ``width`` x ``height`` window"""
+    s = shadow_slice(offset, blur)
+    shadow_width, shadow_height = width + offset * 2, height + offset * 2
+    if shadow_height <= s * 2 + 1:
+        return drop_shadow(width, height, offset, blur).crop((0, top, shadow_width, bottom))
+
+    band = shadow_band(width, offset, blur)
+    strip = Image.new('RGBA', (shadow_width, bottom - top))
+    # Top edge
+    if top < s:
+        strip.paste(band.crop((0, top, shadow_width, min(bottom, s))), (0, 0))
+    # Flat middle, stretched from a single row
+    middle_top, middle_bottom = max(top, s), min(bottom, shadow_height - s)
+    if middle_top < middle_bottom:
+        row = band.crop((0, s, shadow_width, s + 1))
+        strip.paste(row.resize((shadow_width, middle_bottom - middle_top), Image.NEAREST), (0, middle_top - top))
+    # Bottom edge
+    edge_top = max(top, shadow_height - s)
+    if edge_top < bottom:
+        shift = s * 2 + 1 - shadow_height
+        strip.paste(band.crop((0, edge_top + shift, shadow_width, bottom + shift)), (0, edge_top - top))
+    return strip
+
+
+def window_rows(formatter, width, height, code_height, title, include_circles, top, bottom, scale=1):
+    """Rows ``top`` to ``bottom`` of the window (gradient, code and title bar), with alpha"""
+    title_height = scaled(TITLE_HEIGHT, scale) if title else 0
+    window = gradient_column(height).crop((0, top, 1, bottom)).resize((width, bottom - top), Image.NEAREST)
+
+    # Only the strips at either end have rounded corners
+    radius = scaled(CORNER_RADIUS, scale)
+    alpha = Image.new('L', (width, bottom - top), 255)
+    top_left, top_right, bottom_left, bottom_right = corner_pieces(radius)
+    if top < radius:
+        alpha.paste(top_left, (0, -top))
+        alpha.paste(top_right, (width - radius, -top))
+    if bottom > height - radius:
+        alpha.paste(bottom_left, (0, height - radius - top))
+        alpha.paste(bottom_right, (width - radius, height - radius - top))
+    window.putalpha(alpha)
+
+    code_top, code_bottom = max(top, title_height), min(bottom, title_height + code_height)
+    if code_top < code_bottom:
+        code = Image.new('RGB', (width, code_bottom - code_top), formatter.background_color)
+        formatter.paint(code, code_top - title_height)
+        window.paste(code, (0, code_top - top))
+
+    if title and top < title_height + scaled(SHADOW_SLICE, scale):
+        draw_title(ImageDraw.Draw(window), width, title, include_circles, top, scale)
+    return window
+
+
+def iter_strips(formatter, code_size, title, include_circles=False, strip_height=STRIP_HEIGHT, scale=1):
+    """
+    Yield the finished image of the code laid out by ``formatter`` as RGBA
+    strips of ``strip_height`` rows, top to bottom. Stacked, they match
+    ``apply_chrome(formatter.render(...))`` pixel for pixel.
+    """
+    width, code_height = code_size
+    height = code_height + scaled(TITLE_HEIGHT, scale) if title else code_height
+    offset, blur = scaled(SHADOW_OFFSET, scale), scaled(SHADOW_BLUR, scale)
+    final_height = height + offset * 2
+
+    for top in range(0, final_height, strip_height):
+        bottom = min(top + strip_height, final_height)
+        strip = shadow_rows(width, height, top, bottom, offset, blur)
+        window_top, window_bottom = max(top - offset, 0), min(bottom - offset, height)
+        if window_top < window_bottom:
+            window = window_rows(formatter, width, height, code_height, title, include_circles,
+                                 window_top, window_bottom, scale)
+            strip.paste(window, (offset, window_top + offset - top), window)
+        yield strip
+
+
+def final_size(code_size, title, scale=1):
+    width, height = code_size
+    if title:
+        height += scaled(TITLE_HEIGHT, scale)
+    offset = scaled(SHADOW_OFFSET, scale)
+    return width + offset * 2, height + offset * 2
+
+
+def svg_image(formatter, tokens, code_size, title, include_circles=False, scale=1):
+    """
+    The finished image as an SVG document, for code already laid out by
+    ``formatter``: the same size, window and shadow as the raster image, with
+    the code as text from Pygments' SvgFormatter.
+    """
+    width, code_height = code_size
+    title_height = scaled(TITLE_HEIGHT, scale) if title else 0
+    height = code_height + title_height
+    offset = scaled(SHADOW_OFFSET, scale)
+    final_width, final_height = final_size(code_size, title, scale)
+
+    line_height = formatter._get_line_height()
+    ascent = formatter.fonts.get_font(False, False).getmetrics()[0]
+    font_family = escape(f"{formatter.options.get('font_name') or 'monospace'}, monospace")
+    font_size = formatter.fonts.font_size
+
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{final_width}" height="{final_height}" '
+        f'viewBox="0 0 {final_width} {final_height}">',
+        '<defs>',
+        '<linearGradient id="window-bg" x1="0" y1="0" x2="0" y2="1">'
+        '<stop offset="0" stop-color="#1F2430"/><stop offset="1" stop-color="#262D3D"/></linearGradient>',
+        f'<filter id="shadow" filterUnits="userSpaceOnUse" x="0" y="0" width="{final_width}" height="{final_height}">'
+        f'<feGaussianBlur stdDeviation="{scaled(SHADOW_BLUR, scale)}"/></filter>',
+        f'<clipPath id="window-shape"><rect width="{width}" height="{height}" '
+        f'rx="{scaled(CORNER_RADIUS, scale)}"/></clipPath>',
+        '</defs>',
+        # Same black at alpha 20 as the raster shadow
+        f'<rect x="{offset}" y="{offset}" width="{width}" height="{height}" fill="#000" '
+        f'fill-opacity="{20 / 255:.4f}" filter="url(#shadow)"/>',
+        f'<g transform="translate({offset} {offset})" clip-path="url(#window-shape)">',
+        f'<rect width="{width}" height="{height}" fill="url(#window-bg)"/>',
+        f'<g transform="translate(0 {title_height})">',
+        f'<rect width="{width}" height="{code_height}" fill="{formatter.background_color}"/>',
+    ]
+    if formatter.line_numbers and formatter.line_number_fg is not None:
+        gutter_width = formatter.image_pad + formatter.line_number_width - formatter.line_number_pad + 1
+        parts.append(f'<rect width="{gutter_width}" height="{code_height}" fill="{formatter.line_number_bg}"/>')
+    for line in formatter.hl_lines:
+        x = formatter.image_pad + formatter.line_number_width - formatter.line_number_pad + 1
+        parts.append(
+            f'<rect x="{x}" y="{formatter._get_line_y(line - 1)}" width="{width - x}" '
+            f'height="{line_height}" fill="{formatter.hl_color}"/>'
+        )
+
+    parts.append(f'<g font-family="{font_family}" font-size="{font_size}px">')
+    baseline = formatter.image_pad + ascent
+    if formatter.line_numbers:
+        number_x = formatter.image_pad + formatter.line_number_chars * formatter.fontw
+        for line in range(formatter.maxlineno):
+            number = line + formatter.line_number_start
+            if number % formatter.line_number_step == 0:
+                parts.append(
+                    f'<text x="{number_x}" y="{baseline + line * line_height}" text-anchor="end" '
+                    f'fill="{formatter.line_number_fg}">{number}</text>'
+                )
+    svg_formatter = SvgFormatter(
+        nowrap=True, style=formatter.style,
+        xoffset=formatter._get_char_x(0), yoffset=baseline, ystep=line_height,
+    )
+    # SvgFormatter writes one <text> per line, with a <tspan> per styled token
+    code_svg = io.StringIO()
+    svg_formatter.format_unencoded(tokens, code_svg)
+    parts.append(code_svg.getvalue())
+    parts.append('</g></g>')
+
+    if title:
+        if include_circles:
+            radius = scaled(CIRCLE_SIZE, scale) / 2
+            for left, color in CIRCLES:
+                parts.append(
+                    f'<circle cx="{scaled(left, scale) + radius:g}" cy="{scaled(CIRCLE_Y, scale)}" '
+                    f'r="{radius:g}" fill="{color}"/>'
+                )
+        title_size = scaled(TITLE_SIZE, scale)
+        parts.append(
+            f'<text x="{width / 2}" y="{scaled(TITLE_TOP, scale) + title_size}" text-anchor="middle" '
+            f'font-family="Arial, sans-serif" font-size="{title_size}px" fill="#FFFFFF">{escape(title)}</text>'
+        )
+    parts.append('</g></svg>')
+    return "\n".join(parts) + "\n"
+
+
+def render_image(code, language="python", title="untitled", include_circles=False, formatter_options=None,
+                 scale=1):
+    """Render a snippet to a finished RGBA image without touching any GUI state"""
+    img = render_code(code, language, formatter_options, scale)
+    return apply_chrome(img, title, include_circles, scale)
+
+
+class StageTimer:
+    """Adds up the wall time spent in each named stage: ``with timer.stage("lex"): ...``"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def encode_image(code, language="python", title="untitled", include_circles=False, formatter_options=None,
+                 output=None, scale=1):
+    """Render a snippet straight to encoded image bytes in the ``output`` format, without touching disk"""
+    title = title.strip() or "untitled"
+    code = code.strip()
+    if not code:
+        raise ValueError("Cannot export empty code cell")
+    output = encoders.output_settings(output)
+
+    if output["format"] == "svg":
+        tokens = list(get_lexer(language).get_tokens(code))
+        formatter = get_formatter(formatter_key(formatter_options, scale))
+        with _formatter_lock:
+            code_size = formatter.layout(tokens)
+            return svg_image(formatter, tokens, code_size, title, include_circles, scale).encode("utf-8")
+
+    buffer = io.BytesIO()
+    image = render_image(code, language, title, include_circles, formatter_options, scale)
+    encoders.save_image(image, buffer, output)
+    return buffer.getvalue()
+
+
+def lines_per_page(formatter, max_lines=None, max_height=None):
+    """How many lines fit on one page under the given limits, or None for no limit"""
+    limits = []
+    if max_lines:
+        limits.append(max_lines)
+    if max_height:
+        chrome = formatter.image_pad * 2 + TITLE_HEIGHT + SHADOW_OFFSET * 2
+        limits.append((max_height - chrome) // formatter._get_line_height())
+    return max(1, min(limits)) if limits else None
+
+
+def paginate(tokens, page_lines=None):
+    """
+    Split a token stream into pages of at most ``page_lines`` lines. Returns a
+    list of ``(first line number, tokens)``.
+    """
+    if not page_lines:
+        return [(1, list(tokens))]
+
+    pages = [(1, [])]
+    line_count = 0
+    for ttype, value in tokens:
+        for index, part in enumerate(value.split("\n")):
+            if index:
+                pages[-1][1].append((ttype, "\n"))
+                line_count += 1
+                if line_count % page_lines == 0:
+                    pages.append((line_count + 1, []))
+            if part:
+                pages[-1][1].append((ttype, part))
+    if len(pages) > 1 and not pages[-1][1]:
+        pages.pop()
+    return pages
+
+
+def write_if_changed(path, data):
+    """
+    Write ``data`` to ``path`` unless the file already holds exactly those
+    bytes, so re-rendering an unchanged snippet leaves its image (and mtime)
+    alone. Returns True if the file was written.
+    """
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+
+def scale_factors(scales=None):
+    """Validated, de-duplicated scale factors in the order given (default: just 1x)"""
+    factors = []
+    for scale in scales or (1,):
+        if isinstance(scale, str):
+            scale = scale.strip().lower().rstrip("x")
+        scale = float(scale)
+        if not 0 < scale <= 8:
+            raise ValueError(f"Scale factors must be above 0 and at most 8, not {scale:g}")
+        scale = int(scale) if scale.is_integer() else scale
+        if scale not in factors:
+            factors.append(scale)
+    return factors
+
+
+def export_image(code, language, title, folder, include_circles=False, formatter_options=None,
+                 max_lines=None, max_height=None, output=None, stats=None, scales=None):
+    """
+    Render a snippet and save it as ``<folder>/<clean title>.png``. Returns the
+    list of paths written.
+
+    ``output`` holds encoder settings (see ``encoders.DEFAULT_SETTINGS``): the
+    format (PNG, palette PNG, lossless WebP or SVG, which sets the extension)
+    and its compression options.
+
+    With ``max_lines`` or ``max_height`` (in pixels) a long snippet is split
+    into pages saved as ``<clean title>_<n>.png``, numbered in their titles and
+    continuing the line numbers. Code is only lexed once either way. PNGs
+    taller than STREAM_MIN_HEIGHT are painted and encoded in strips instead of
+    being built in memory as a whole.
+
+    ``scales`` (e.g. ``[1, 2, 3]``) saves each page once per scale factor,
+    with fonts, padding and chrome scaled to match and ``@2x``-style suffixes
+    on all but 1x. Every scale reuses the same tokens and page breaks, which
+    are measured at 1x.
+
+    If a ``stats`` dict is given, it is filled with the seconds spent per stage
+    (``"stages"``) and the size and bytes written of each image (``"pages"``).
+    Streamed images are timed as a single ``"stream"`` stage. Images whose
+    bytes didn't change are not rewritten (``"written"`` is False).
+    """
+    title = title.strip() or "untitled"
+    code = code.strip()
+    if not code:
+        raise ValueError("Cannot export empty code cell")
+    if (max_lines is not None and max_lines <= 0) or (max_height is not None and max_height <= 0):
+        raise ValueError("Page limits must be at least 1 line or 1 pixel")
+    output = encoders.output_settings(output)
+    extension = encoders.FORMATS[output["format"]]
+    scales = scale_factors(scales)
+
+    timer = StageTimer()
+    page_stats = []
+
+    with timer.stage("lex"):
+        lexer = get_lexer(language)
+        formatters = {scale: get_formatter(formatter_key(formatter_options, scale)) for scale in scales}
+        page_formatter = get_formatter(formatter_key(formatter_options))
+        pages = paginate(lexer.get_tokens(code), lines_per_page(page_formatter, max_lines, max_height))
+
+    os.makedirs(folder, exist_ok=True)
+    image_paths = []
+    for number, (first_line, tokens) in enumerate(pages, 1):
+        page_title = title if len(pages) == 1 else f"{title} ({number}/{len(pages)})"
+        for scale in scales:
+            if len(pages) == 1:
+                image_path = image_path_for(folder, title, extension, scale)
+            else:
+                image_path = page_path_for(folder, title, number, extension, scale)
+            formatter = formatters[scale]
+
+            with _formatter_lock:
+                with timer.stage("layout"):
+                    code_size = formatter.layout(tokens, first_line)
+                size = final_size(code_size, page_title, scale)
+                if output["format"] == "svg":
+                    with timer.stage("encode"):
+                        data = svg_image(formatter, tokens, code_size, page_title, include_circles, scale)
+                    with timer.stage("write"):
+                        written = write_if_changed(image_path, data.encode("utf-8"))
+                elif size[1] > STREAM_MIN_HEIGHT and encoders.streams(output):
+                    with timer.stage("stream"):
+                        level = 9 if output["optimize"] else output["compress_level"]
+                        strips = iter_strips(formatter, code_size, page_title, include_circles, scale=scale)
+                        encoders.write_png_strips(image_path, size, strips, level)
+                        written = True
+                else:
+                    with timer.stage("rasterize"):
+                        img = Image.new('RGB', code_size, formatter.background_color)
+                        formatter.paint(img)
+                    with timer.stage("chrome"):
+                        final_image = apply_chrome(img, page_title, include_circles, scale)
+                    # Encode in memory first so disk time shows up on its own
+                    with timer.stage("encode"):
+                        buffer = io.BytesIO()
+                        # Save with transparency
+                        encoders.save_image(final_image, buffer, output)
+                    with timer.stage("write"):
+                        written = write_if_changed(image_path, buffer.getbuffer())
+            image_paths.append(image_path)
+            page_stats.append({
+                "path": image_path, "size": list(size), "bytes": os.path.getsize(image_path), "written": written,
+                "scale": scale,
+            })
+
+    if stats is not None:
+        stats["stages"] = timer.stages
+        stats["pages"] = page_stats
+    return image_paths
@@ -0,0 +1,183 @@
+import re
+
+# Characters that make a regex more than a plain string
+REGEX_SPECIAL = set(".^$*+?{}[]\\|()")
+
+# Only runs of word characters are indexed; any query substring made of word
+# characters lies inside one of them
+WORD = re.compile(r"\w{3,}")
+
+
+def cell_text(cell):
+    """What a cell is searched by: its title and code, lowercased"""
+    return f"{cell.title}\n{cell.code}".lower()
+
+
+def trigrams(text):
+    """The three-character substrings of the words in ``text``"""
+    grams = set()
+    for word in set(WORD.findall(text)):
+        grams.update([word[i:i + 3] for i in range(len(word) - 2)])
+    return grams
+
+
+def compile_query(pattern):
+    """
+    A case-insensitive regex for searching lowercased text. Where lowering the
+    pattern can't change its meaning (no escapes like ``\\S`` and no inline
+    flags), it is lowered and compiled without IGNORECASE, which makes
+    ``re`` several times faster.
+    """
+    if re.search(r"\\[A-Z]|\(\?", pattern):
+        return re.compile(pattern, re.IGNORECASE | re.MULTILINE)
+    return re.compile(pattern.lower(), re.MULTILINE)
+
+
+def required_literals(pattern):
+    """
+    Plain-text runs that every match of ``pattern`` must contain, or an empty
+    list if that can't be told cheaply (alternations and groups can make any
+    part optional, so those patterns get no hint).
+    """
+    unescaped = re.sub(r"\\.", "", pattern)
+    if "|" in unescaped or "(" in unescaped:
+        return []
+    literals = []
+    run = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" or char == "[":
+            # Escapes and character classes end the run and are skipped over
+            literals.append(run)
+            run = ""
+            if char == "\\":
+                i += 2
+            else:
+                i = pattern.find("]", i + 2) + 1 or len(pattern)
+            continue
+        if char in "?*{":
+            # The last character may be repeated zero times
+            literals.append(run[:-1])
+            run = ""
+            if char == "{":
+                # Skip the counts: the digits of "x{100}" are not text to match
+                i = pattern.find("}", i + 1) + 1 or len(pattern)
+                continue
+        elif char in REGEX_SPECIAL:
+            literals.append(run)
+            run = ""
+        else:
+            run += char
+        i += 1
+    literals.append(run)
+    return [literal for literal in literals if len(literal) >= 3]
+
+
+class SearchIndex:
+    """
+    Trigram index over the titles and code of a project's cells.
+
+    Every word of a cell's lowercased text is broken into its three-character
+    substrings, and each trigram maps to the set of cells containing it. A
+    query only checks the cells that contain all of its trigrams, so most
+    cells are never scanned.
+
+    Edited cells are marked stale and re-indexed on the next query, or in idle
+    time through ``refresh(limit)``. A cell is only re-indexed if its content
+    hash changed.
+    """
+
+    def __init__(self, cells=()):
+        self.postings = {}  # trigram -> set of cells containing it
+        self.indexed = {}   # cell -> (content hash, text as indexed)
+        self.stale = set()
+        self.reset(cells)
+
+    def reset(self, cells):
+        """Forget everything and queue ``cells`` for indexing"""
+        self.postings = {}
+        self.indexed = {}
+        self.stale = set(cells)
+
+    def add(self, cell):
+        """Index ``cell``, or re-index it if it changed"""
+        self.stale.discard(cell)
+        content_hash = cell.content_hash
+        if cell in self.indexed:
+            if self.indexed[cell][0] == content_hash:
+                return
+            self.remove(cell)
+        text = cell_text(cell)
+        for gram in trigrams(text):
+            self.postings.setdefault(gram, set()).add(cell)
+        self.indexed[cell] = (content_hash, text)
+
+    def remove(self, cell):
+        self.stale.discard(cell)
+        if cell not in self.indexed:
+            return
+        _, text = self.indexed.pop(cell)
+        for gram in trigrams(text):
+            cells = self.postings[gram]
+            cells.discard(cell)
+            if not cells:
+                del self.postings[gram]
+
+    def mark_stale(self, cell):
+        """Note that ``cell`` was edited; it is re-indexed when next searched"""
+        self.stale.add(cell)
+
+    def refresh(self, limit=None):
+        """Index up to ``limit`` (default: all) stale cells; returns True if some are left"""
+        while self.stale and limit != 0:
+            self.add(self.stale.pop())
+            if limit is not None:
+                limit -= 1
+        return bool(self.stale)
+
+    def candidates(self, literals):
+        """Indexed cells containing the trigrams of every literal, or None if there are no trigrams"""
+        grams = set()
+        for literal in literals:
+            grams |= trigrams(literal)
+        if not grams:
+            return None
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        found = set(postings[0])
+        for cells in postings[1:]:
+            found &= cells
+            if not found:
+                break
+        return found
+
+    def search(self, cells, query, regex=False):
+        """
+        Indexes into ``cells`` of the cells whose title or code match
+        ``query``, in order. Matching is case-insensitive. ``query`` is a
+        plain substring, or a regular expression if ``regex`` is set; an
+        invalid regex raises re.error.
+        """
+        if not query:
+            return []
+        self.refresh()
+        if regex:
+            matcher = compile_query(query).search
+            literals = required_literals(query.lower())
+        else:
+            query = query.lower()
+            matcher = lambda text: query in text
+            literals = [query]
+
+        found = self.candidates(literals)
+        matches = []
+        for index, cell in enumerate(cells):
+            if found is not None and cell not in found and cell in self.indexed:
+                continue
+            if cell in self.indexed:
+                text = self.indexed[cell][1]
+            else:
+                text = cell_text(cell)  # Not given to the index; can't be ruled out
+            if matcher(text):
+                matches.append(index)
+        return matches
@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import threading
+import socketserver
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pygments.util import OptionError
+
+import encoders
+import exporter
+import project
+import renderer
+import render_cache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Requests arriving within this many seconds of each other go to the pool together
+BATCH_WINDOW = 0.005
+MAX_BATCH = 32
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+MAX_REQUEST_BYTES = 4 * 1024 * 1024
+REQUEST_TIMEOUT = 120
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "png-palette": "image/png",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+}
+
+# Formatter options a request may override
+STYLE_OPTIONS = set(renderer.FORMATTER_OPTIONS) | {"hl_lines", "line_number_start"}
+
+# JSON values a style option may take (or a list of them)
+SCALAR_TYPES = (str, int, float, bool)
+
+
+class RenderError(Exception):
+    def __init__(self, message, invalid=False):
+        Exception.__init__(self, message)
+        self.invalid = invalid  # the request was bad, not the server
+
+
+def parse_job(payload):
+    """
+    Turn a request body into a render job tuple
+    ``(code, language, title, include_circles, formatter_options, output)``.
+    Raises ValueError for malformed requests.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    code = payload.get("code")
+    if not isinstance(code, str) or not code.strip():
+        raise ValueError("'code' must be a non-empty string")
+    language = payload.get("language", "python")
+    title = payload.get("title", "untitled")
+    if not isinstance(language, str) or not isinstance(title, str):
+        raise ValueError("'language' and 'title' must be strings")
+
+    style = payload.get("style") or {}
+    if not isinstance(style, dict):
+        raise ValueError("'style' must be an object")
+    formatter_options = {}
+    for key, value in style.items():
+        if key not in STYLE_OPTIONS:
+            raise ValueError(f"Unknown style option: {key}")
+        # Formatter options are cache keys, so they must be hashable
+        if isinstance(value, list) and all(isinstance(item, SCALAR_TYPES) for item in value):
+            value = " ".join(str(item) for item in value)
+        elif value is not None and not isinstance(value, SCALAR_TYPES):
+            raise ValueError(f"Style option '{key}' must be a string, number, boolean or list of those")
+        formatter_options[key] = value
+
+    output = payload.get("output") or {}
+    if not isinstance(output, dict):
+        raise ValueError("'output' must be an object")
+    if payload.get("format") is not None:
+        # "format" is shorthand for output.format; both may be given if they agree
+        if output.get("format") not in (None, payload["format"]):
+            raise ValueError("'format' and 'output.format' disagree")
+        output = dict(output, format=payload["format"])
+    output = encoders.output_settings(output)
+    return (code, language, title, bool(payload.get("circles")), formatter_options, output)
+
+
+def job_key(job):
+    code, language, title, include_circles, formatter_options, output = job
+    cell = project.Cell(title, language, code)
+    return render_cache.cell_key(cell, include_circles, formatter_options, {"output": output})
+
+
+def render_batch(jobs):
+    """Render jobs in a worker process; returns ``(image bytes, error, invalid request)`` per job"""
+    outcomes = []
+    for code, language, title, include_circles, formatter_options, output in jobs:
+        try:
+            data = renderer.encode_image(code, language, title, include_circles, formatter_options, output)
+            outcomes.append((data, None, False))
+        except (ValueError, TypeError, OptionError) as e:
+            # Includes Pygments' ClassNotFound for unknown languages and
+            # OptionError for style values it can't use (e.g. font_size "abc")
+            outcomes.append((None, str(e), True))
+        except Exception as e:
+            outcomes.append((None, str(e) or e.__class__.__name__, False))
+    return outcomes
+
+
+class RenderLRU:
+    """Recently rendered images by job key, dropping the least recently used past ``max_bytes``"""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        data = self.items.get(key)
+        if data is not None:
+            self.items.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        if key in self.items:
+            self.size -= len(self.items.pop(key))
+        self.items[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.items.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class RenderBatcher:
+    """
+    Queues render jobs from the request threads and hands them to the shared
+    warm process pool in batches: jobs that arrive within BATCH_WINDOW of each
+    other are split across the workers in one task each, instead of paying
+    the pool round trip per request. Identical jobs in flight are rendered
+    once, and finished images are kept in a RenderLRU.
+    """
+
+    def __init__(self, workers=None, window=BATCH_WINDOW, cache_bytes=DEFAULT_CACHE_BYTES):
+        self.workers = max(1, workers or exporter.default_workers())
+        self.window = window
+        self.cache = RenderLRU(cache_bytes)
+        self.lock = threading.Lock()
+        self.in_flight = {}  # job key -> Future shared by every request waiting for it
+        self.jobs = queue.Queue()
+        self.stats = {"requests": 0, "cache_hits": 0, "renders": 0, "batches": 0, "errors": 0}
+        self.pool_broken = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        # Start the pool now so the first request doesn't wait for it
+        exporter.get_pool(self.workers)
+        self.thread.start()
+
+    def stop(self):
+        self.jobs.put(None)
+        self.thread.join()
+        exporter.shutdown_pool()
+
+    def submit(self, job):
+        """Returns a Future for the encoded image bytes of ``job``"""
+        key = job_key(job)
+        with self.lock:
+            self.stats["requests"] += 1
+            data = self.cache.get(key)
+            if data is not None:
+                self.stats["cache_hits"] += 1
+                future = Future()
+                future.set_result(data)
+                return future
+            if key in self.in_flight:
+                return self.in_flight[key]
+            future = self.in_flight[key] = Future()
+        self.jobs.put((key, job))
+        return future
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            item = self.jobs.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < MAX_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.jobs.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self.dispatch(batch)
+
+    def dispatch(self, batch):
+        with self.lock:
+            self.stats["batches"] += 1
+        if self.pool_broken:
+            # A worker died in an earlier batch; start a fresh pool
+            exporter.shutdown_pool()
+            self.pool_broken = False
+        pool = exporter.get_pool(self.workers)
+        size = -(-len(batch) // self.workers)  # ceil: one task per worker
+        for start in range(0, len(batch), size):
+            part = batch[start:start + size]
+            try:
+                future = pool.submit(render_batch, [job for _, job in part])
+            except Exception as e:
+                # The pool broke since the last batch; fail this part instead of the batcher
+                future = Future()
+                future.set_exception(e)
+            future.add_done_callback(lambda future, part=part: self.finish(part, future))
+
+    def finish(self, part, future):
+        try:
+            outcomes = future.result()
+        except Exception as e:
+            self.pool_broken = True
+            outcomes = [(None, f"Render process failed: {e}", False)] * len(part)
+
+        for (key, _), (data, error, invalid) in zip(part, outcomes):
+            with self.lock:
+                waiting = self.in_flight.pop(key)
+                if error:
+                    self.stats["errors"] += 1
+                else:
+                    self.stats["renders"] += 1
+                    self.cache.put(key, data)
+            if error:
+                waiting.set_exception(RenderError(error, invalid))
+            else:
+                waiting.set_result(data)
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    """
+    ``POST /render`` with a JSON body ``{"code", "language", "title", "circles",
+    "style": {formatter options}, "format" or "output": {encoder settings}}``
+    returns the image bytes. ``GET /health`` returns server stats.
+    """
+
+    server_version = "codecanvas"
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_json(404, {"error": "Not found"})
+            return
+        batcher = self.server.batcher
+        with batcher.lock:
+            stats = dict(batcher.stats, cached_images=len(batcher.cache.items), cache_bytes=batcher.cache.size)
+        self.send_json(200, dict(stats, workers=batcher.workers))
+
+    def do_POST(self):
+        if self.path != "/render":
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if not 0 < length <= MAX_REQUEST_BYTES:
+            self.send_json(413 if length > MAX_REQUEST_BYTES else 411, {"error": "Bad Content-Length"})
+            return
+
+        try:
+            job = parse_job(json.loads(self.rfile.read(length)))
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        try:
+            data = self.server.batcher.submit(job).result(timeout=REQUEST_TIMEOUT)
+        except RenderError as e:
+            self.send_json(400 if e.invalid else 500, {"error": str(e)})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": str(e) or e.__class__.__name__})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES[job[5]["format"]])
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, batcher=None, verbose=False):
+    """An HTTP server on ``host:port``, or on a Unix socket if ``socket_path`` is given"""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # left behind by a previous run
+        server = UnixHTTPServer(socket_path, RenderHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RenderHandler)
+        server.daemon_threads = True
+    server.batcher = batcher or RenderBatcher()
+    server.verbose = verbose
+    return server
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, workers=None,
+          window=BATCH_WINDOW, cache_bytes=DEFAULT_CACHE_BYTES, verbose=False):
+    batcher = RenderBatcher(workers, window, cache_bytes)
+    server = make_server(host, port, socket_path, batcher, verbose)
+    batcher.start()
+    where = socket_path or f"http://{host}:{server.server_address[1]}"
+    print(f"Serving on {where} with {batcher.workers} workers (Ctrl+C to stop)", file=sys.stderr)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # Shut the pool down cleanly when stopped by a service manager too
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
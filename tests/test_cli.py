@@ -0,0 +1,30 @@
+import pytest
+
+import cli
+
+
+@pytest.mark.parametrize("argv", [
+    ["render", "proj", "--max-lines", "0"],
+    ["render", "proj", "--max-lines", "-1"],
+    ["render", "proj", "--max-height", "0"],
+    ["sheet", "proj", "out.pdf", "--page-height", "-5"],
+    ["render", "proj", "--scales", "0"],
+    ["sheet", "proj", "out.png", "--cells", "a"],
+])
+def test_rejects_invalid_arguments(argv):
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args(argv)
+
+
+def test_parses_lists():
+    args = cli.build_parser().parse_args(["sheet", "proj", "out.png", "--cells", "1,4-6", "--scale", "2x"])
+    assert args.cells == [1, 4, 5, 6]
+    assert args.scale == 2
+
+
+def test_export_image_rejects_page_limits_below_one(tmp_path):
+    import renderer
+
+    for limits in ({"max_lines": 0}, {"max_lines": -1}, {"max_height": 0}):
+        with pytest.raises(ValueError):
+            renderer.export_image("x = 1", "python", "t", str(tmp_path), **limits)
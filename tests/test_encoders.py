@@ -0,0 +1,134 @@
+import os
+
+import pytest
+from PIL import Image, ImageChops
+
+import encoders
+
+
+def noise_image(size, mode="RGBA"):
+    return Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode)))
+
+
+def assert_same_pixels(a, b):
+    assert a.size == b.size
+    assert ImageChops.difference(a.convert("RGBA"), b.convert("RGBA")).getbbox() is None
+
+
+def test_streamed_png_matches_image(tmp_path):
+    image = noise_image((37, 101))
+    path = str(tmp_path / "strips.png")
+    # Uneven strips, including a single row
+    bounds = [0, 1, 40, 41, 100, 101]
+    encoders.write_png_strips(
+        path, image.size, (image.crop((0, top, 37, bottom)) for top, bottom in zip(bounds, bounds[1:])),
+    )
+    with Image.open(path) as saved:
+        assert_same_pixels(saved, image)
+
+
+def test_streamed_png_rejects_missing_rows(tmp_path):
+    with open(tmp_path / "short.png", "wb") as f:
+        writer = encoders.StreamingPNGWriter(f, 10, 10)
+        writer.write_strip(noise_image((10, 9)))
+        with pytest.raises(ValueError):
+            writer.close()
+
+
+def test_streamed_png_matches_apply_chrome(tmp_path):
+    renderer = pytest.importorskip("renderer")
+    from pygments.formatters.img import FontNotFound
+
+    try:
+        formatter = renderer.get_formatter(renderer.formatter_key())
+    except (FontNotFound, OSError):
+        pytest.skip("no monospace font (or fc-list) available")
+    code = "\n".join(f"def f{i}(x):\n    return x * {i}  # {'#' * (i % 7)}" for i in range(40))
+    tokens = list(renderer.get_lexer("python").get_tokens(code))
+    title = "streamed"
+    with renderer._formatter_lock:
+        expected = renderer.apply_chrome(formatter.render(tokens), title, include_circles=True)
+        code_size = formatter.layout(tokens)
+        path = str(tmp_path / "chrome.png")
+        encoders.write_png_strips(
+            path, renderer.final_size(code_size, title),
+            renderer.iter_strips(formatter, code_size, title, include_circles=True, strip_height=50),
+        )
+    with Image.open(path) as saved:
+        assert_same_pixels(saved, expected)
+
+
+def read_pdf(data):
+    """The objects of a PDF written by StreamingPDFWriter, by number, checked against its xref table"""
+    xref = int(data.rsplit(b"startxref", 1)[1].split()[0])
+    assert data[xref:].startswith(b"xref\n")
+    lines = data[xref:].split(b"\n")
+    count = int(lines[1].split()[1])
+    offsets = [int(line.split()[0]) for line in lines[3:2 + count]]
+    assert data[xref:].split(b"trailer", 1)[1].startswith(b"\n<< /Size %d /Root 1 0 R >>" % count)
+    objects = {}
+    for number, offset in enumerate(offsets, 1):
+        assert data[offset:].startswith(b"%d 0 obj\n" % number)
+        objects[number] = data[offset:data.index(b"\nendobj\n", offset)]
+    return objects
+
+
+def unfilter_up(data, width, height, channels):
+    stride = width * channels
+    previous = bytearray(stride)
+    rows = bytearray()
+    for y in range(height):
+        line = data[y * (stride + 1):(y + 1) * (stride + 1)]
+        assert line[0] == 2
+        previous = bytearray((a + b) & 0xFF for a, b in zip(line[1:], previous))
+        rows += previous
+    return bytes(rows)
+
+
+def test_streamed_pdf_xref_and_pages(tmp_path, monkeypatch):
+    import re
+    import zlib
+
+    # Small bands so a page spans several of them
+    monkeypatch.setattr(encoders, "PDF_BAND_HEIGHT", 7)
+    pages = [noise_image((20, 30), "RGB"), noise_image((45, 16), "RGB")]
+    path = tmp_path / "pages.pdf"
+    with open(path, "wb") as f:
+        writer = encoders.StreamingPDFWriter(f, dpi=144)
+        for page in pages:
+            writer.add_page(page)
+        writer.close()
+
+    objects = read_pdf(path.read_bytes())
+    assert b"/Kids [5 0 R 8 0 R] /Count 2" in objects[2]
+    for page, number in zip(pages, (3, 6)):
+        body = objects[number]
+        width, height, length = map(int, re.search(rb"/Width (\d+) /Height (\d+).*/Length (\d+)", body).groups())
+        assert (width, height) == page.size
+        stream = body[body.index(b"stream\n") + 7:]
+        assert stream[length:] == b"\nendstream"
+        pixels = unfilter_up(zlib.decompress(stream[:length]), width, height, 3)
+        assert pixels == page.tobytes()
+    # 144 dpi: two pixels per 1/72 inch point
+    assert b"/MediaBox [0 0 10.00 15.00]" in objects[5]
+
+
+def test_streamed_pdf_needs_a_page(tmp_path):
+    with open(tmp_path / "empty.pdf", "wb") as f:
+        writer = encoders.StreamingPDFWriter(f)
+        with pytest.raises(ValueError):
+            writer.close()
+
+
+@pytest.mark.parametrize("settings", [
+    {"format": "gif"},
+    {"compress_level": 10},
+    {"compress_level": "5"},
+    {"colors": 1},
+    {"webp_method": 7},
+    {"webp_method": -1},
+    {"webp_method": True},
+])
+def test_output_settings_rejects_bad_values(settings):
+    with pytest.raises(ValueError):
+        encoders.output_settings(settings)
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+import highlighter
+
+# Pieces typed into the buffer: openers and closers of comments and strings
+# in several languages, plus ordinary code
+FRAGMENTS = [
+    "/*", "*/", "/**", '"', "'", '"""', "'''", "`", "\n", "\n", "\n", "x = 1;", "{", "}", "//", "#",
+    "\\", "<!--", "-->", "foo(bar)", " ", "def f():", "a.b", "@", "$x", "0x1F", "(*", "*)", ";",
+]
+LANGUAGES = ["python", "javascript", "java", "go", "css", "kotlin", "csharp", "sql", "bash", "c"]
+
+
+def full_lex(lexer, text):
+    """Per-line tokens of a full lex, in the highlighter's format"""
+    line_tokens = [[] for _ in text.split("\n")]
+    line = column = 0
+    for _, ttype, value in lexer.get_tokens_unprocessed(text):
+        for index, part in enumerate(value.split("\n")):
+            if index:
+                line += 1
+                column = 0
+            if part:
+                line_tokens[line].append((column, column + len(part), ttype))
+                column += len(part)
+    return line_tokens
+
+
+@pytest.mark.parametrize("language", LANGUAGES)
+def test_incremental_matches_full_lex(language):
+    rng = random.Random(language)
+    hl = highlighter.IncrementalHighlighter(language)
+    text = ""
+    for _ in range(250):
+        pos = rng.randint(0, len(text))
+        if text and rng.random() < 0.3:
+            text = text[:pos] + text[pos + rng.randint(1, 6):]
+        else:
+            text = text[:pos] + rng.choice(FRAGMENTS) + text[pos:]
+        hl.update(text)
+        assert hl.line_tokens == full_lex(hl.lexer, text), repr(text)
+
+
+@pytest.mark.parametrize("language", ["javascript", "java", "go", "css", "kotlin"])
+def test_closing_a_block_comment_lines_below(language):
+    hl = highlighter.IncrementalHighlighter(language)
+    text = "/* a comment\nfoo bar\nbaz\nqux"
+    hl.update(text)
+    text += " */\nx = 1"
+    hl.update(text)
+    assert hl.line_tokens == full_lex(hl.lexer, text)
+
+
+def test_edit_relexes_only_nearby_lines():
+    hl = highlighter.IncrementalHighlighter("python")
+    lines = [f"value_{i} = {i}  # comment" for i in range(2000)]
+    hl.update("\n".join(lines))
+    lines[1000] = "value_1000 = 'changed'"
+    first, last = hl.update("\n".join(lines))
+    assert first >= 998 and last <= 1002
+
+
+def test_spanning_rules():
+    assert highlighter.rule_opener(r"\s+", 0) is None
+    assert highlighter.rule_opener(r'[^\\"]+', 0)('"') is None
+    opener = highlighter.rule_opener(r"/\*.*?\*/", 24)  # MULTILINE | DOTALL
+    assert opener("/* never closed") and not opener("// line comment")
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import project
+
+
+def make_project(tmp_path, titles):
+    cells = [project.Cell(title, "python", f"print({title!r})") for title in titles]
+    project.save_cells(str(tmp_path), cells)
+    return str(tmp_path)
+
+
+def test_replay_applies_set_insert_remove(tmp_path):
+    project_dir = make_project(tmp_path, ["a", "b", "c"])
+    journal = project.ProjectJournal(project_dir)
+    journal.append([
+        {"op": "set", "index": 0, "cell": {"title": "a2", "language": "c", "code": "x"}},
+        {"op": "insert", "index": 1, "cell": {"title": "new", "language": "python", "code": "y"}},
+        {"op": "remove", "index": 3},
+        {"op": "settings", "settings": {"format": "webp"}},
+    ])
+
+    cells, settings = project.load_project(project_dir)
+    assert [cell.title for cell in cells] == ["a2", "new", "b"]
+    assert cells[0].language == "c" and cells[0].code == "x"
+    assert settings == {"format": "webp"}
+
+
+def test_replay_stops_at_torn_last_line(tmp_path):
+    project_dir = make_project(tmp_path, ["a", "b"])
+    project.ProjectJournal(project_dir).append([
+        {"op": "set", "index": 1, "cell": {"title": "b2", "language": "python", "code": "z"}},
+        {"op": "remove", "index": 0},
+    ])
+    # A crash in the middle of appending the next entry
+    with open(project.journal_file(project_dir), "a") as f:
+        f.write('{"op": "insert", "index": 0, "cell": {"tit')
+
+    cells = project.load_cells(project_dir)
+    assert [cell.title for cell in cells] == ["b2"]
+
+
+def test_replay_ignores_journal_for_another_base(tmp_path):
+    project_dir = make_project(tmp_path, ["a"])
+    project.ProjectJournal(project_dir).append([{"op": "remove", "index": 0}])
+    # file.imgnb changes under the journal, e.g. a compaction that didn't remove it
+    with open(project.project_file(project_dir)) as f:
+        data = json.load(f)
+    data["cells"].append({"title": "b", "language": "python", "code": ""})
+    with open(project.project_file(project_dir), "w") as f:
+        json.dump(data, f)
+
+    cells = project.load_cells(project_dir)
+    assert [cell.title for cell in cells] == ["a", "b"]
+    assert project.replay_journal(project_dir, cells) == 0
+
+
+def test_save_cells_compacts_journal(tmp_path):
+    project_dir = make_project(tmp_path, ["a"])
+    project.ProjectJournal(project_dir).append([
+        {"op": "insert", "index": 1, "cell": {"title": "b", "language": "python", "code": ""}},
+    ])
+    cells = project.load_cells(project_dir)
+    project.save_cells(project_dir, cells)
+
+    assert project.ProjectJournal(project_dir).size() == 0
+    assert [cell.title for cell in project.load_cells(project_dir)] == ["a", "b"]
+
+
+def test_replay_rejects_out_of_range_indexes():
+    cells = []
+    for entry in [
+        {"op": "set", "index": 0, "cell": {"title": "a"}},
+        {"op": "insert", "index": 1, "cell": {"title": "a"}},
+        {"op": "remove", "index": 0},
+        {"op": "insert", "index": -1, "cell": {"title": "a"}},
+    ]:
+        with pytest.raises(IndexError):
+            project.apply_journal_entry(cells, entry)
+    assert cells == []
+
+
+def test_replay_onto_saved_placeholder_cell(tmp_path):
+    # Opening an empty project saves the placeholder cell before edits are journaled
+    project_dir = str(tmp_path)
+    project.save_cells(project_dir, [])
+    cells = project.load_cells(project_dir)
+    assert cells == []
+    project.save_cells(project_dir, [project.Cell()])
+
+    project.ProjectJournal(project_dir).append([
+        {"op": "set", "index": 0, "cell": {"title": "first", "language": "python", "code": "a = 1"}},
+        {"op": "insert", "index": 1, "cell": {"title": "second", "language": "python", "code": "b = 2"}},
+    ])
+    cells = project.load_cells(project_dir)
+    assert [(cell.title, cell.code) for cell in cells] == [("first", "a = 1"), ("second", "b = 2")]
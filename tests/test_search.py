@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+import project
+import search
+
+WORDS = ["def", "return", "print", "value", "values", "Counter", "x" * 120, "foo_bar", "x100", "(a)", "{}", "a|b"]
+
+REGEXES = [
+    r"x{100}", r"x{3,120}", r"x{1000}", r"valu?es", r"def\s+\w+", r"^print", r"counter$", r"(foo|bar)",
+    r"foo_?bar", r"v[a-z]lue", r"\(a\)", r"a\|b", r"ret.rn", r"x100", r"co+unter", r"\d{3}",
+]
+SUBSTRINGS = ["value", "VALUE", "x100", "foo_b", "(a)", "a|b", "ret", "nothing here", "xx", "s\nr"]
+
+
+def random_cells(count, seed=0):
+    rng = random.Random(seed)
+    cells = []
+    for i in range(count):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 3))]
+        cells.append(project.Cell(rng.choice(WORDS + [""]), "python", "\n".join(lines)))
+    return cells
+
+
+def brute_force(cells, query, regex):
+    if regex:
+        matcher = search.compile_query(query).search
+    else:
+        matcher = lambda text: query.lower() in text
+    return [index for index, cell in enumerate(cells) if matcher(search.cell_text(cell))]
+
+
+@pytest.mark.parametrize("query,regex", [(query, True) for query in REGEXES] + [(query, False) for query in SUBSTRINGS])
+def test_search_matches_brute_force(query, regex):
+    cells = random_cells(200)
+    index = search.SearchIndex(cells)
+    assert index.search(cells, query, regex) == brute_force(cells, query, regex)
+
+
+def test_search_follows_edits():
+    cells = random_cells(50, seed=1)
+    index = search.SearchIndex(cells)
+    index.search(cells, "value")
+    cells[3].code = "unique_marker"
+    index.mark_stale(cells[3])
+    removed = cells.pop(10)
+    index.remove(removed)
+    assert index.search(cells, "unique_marker") == [3]
+    assert index.search(cells, "value") == brute_force(cells, "value", False)
+
+
+@pytest.mark.parametrize("pattern,literals", [
+    ("x{100}", []),
+    ("x{1000}y", []),
+    ("abcd{2,300}efgh", ["abc", "efgh"]),
+    ("colou?r", ["colo"]),
+    (r"\(abc\)", ["abc"]),
+    ("abc|def", []),
+])
+def test_required_literals(pattern, literals):
+    assert search.required_literals(pattern) == literals
@@ -0,0 +1,36 @@
+import pytest
+
+import server
+
+
+@pytest.mark.parametrize("payload", [
+    [],
+    {"code": ""},
+    {"code": "x = 1", "style": "abc"},
+    {"code": "x = 1", "style": {"unknown": 1}},
+    {"code": "x = 1", "style": {"hl_lines": {"a": 1}}},
+    {"code": "x = 1", "style": {"hl_lines": [1, [2]]}},
+    {"code": "x = 1", "output": "abc"},
+    {"code": "x = 1", "output": {"compress_level": "5"}},
+    {"code": "x = 1", "output": {"colors": 1}},
+    {"code": "x = 1", "format": ["png"]},
+    {"code": "x = 1", "format": "webp", "output": {"format": "png"}},
+])
+def test_parse_job_rejects_malformed_requests(payload):
+    with pytest.raises(ValueError):
+        server.parse_job(payload)
+
+
+def test_parse_job_makes_style_hashable():
+    job = server.parse_job({"code": "x = 1", "style": {"hl_lines": [1, 3]}, "format": "webp"})
+    assert job[4] == {"hl_lines": "1 3"}
+    assert job[5]["format"] == "webp"
+    hash(server.job_key(job))
+
+
+def test_parse_job_merges_format_into_output():
+    job = server.parse_job({"code": "x = 1", "format": "webp", "output": {"compress_level": 9}})
+    assert job[5]["format"] == "webp"
+    assert job[5]["compress_level"] == 9
+    job = server.parse_job({"code": "x = 1", "format": "webp", "output": {"format": "webp"}})
+    assert job[5]["format"] == "webp"
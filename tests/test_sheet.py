@@ -0,0 +1,58 @@
+import pytest
+from PIL import Image
+
+import project
+import sheet
+
+
+def test_shelf_layout_wraps_rows():
+    rows = sheet.shelf_layout([(40, 10), (40, 30), (40, 20), (200, 5), (10, 10)], width=100, gap=10)
+    assert rows == [
+        (30, [(0, 0), (1, 50)]),
+        (20, [(2, 0)]),
+        (5, [(3, 0)]),  # Wider than the sheet: a row of its own
+        (10, [(4, 0)]),
+    ]
+
+
+def test_page_rows_fill_pages():
+    rows = [(30, []), (30, []), (50, []), (120, [])]
+    pages = sheet.page_rows(rows, height=100, gap=10)
+    assert [[row[0] for row in page] for page in pages] == [[30, 30], [50], [120]]
+
+
+@pytest.fixture
+def formatter_available():
+    import renderer
+    from pygments.formatters.img import FontNotFound
+
+    try:
+        renderer.get_formatter(renderer.formatter_key())
+    except (FontNotFound, OSError):
+        pytest.skip("no monospace font (or fc-list) available")
+
+
+def test_sheet_skips_cells_that_fail(tmp_path, formatter_available):
+    cells = [
+        project.Cell("one", "python", "x = 1"),
+        project.Cell("bad", "nolang", "x"),
+        project.Cell("empty", "python", "  "),
+        project.Cell("two", "c", "int x;"),
+    ]
+    path = str(tmp_path / "sheet.png")
+    pages, errors = sheet.export_sheet(cells, path)
+    assert pages == 1
+    assert [index for index, _ in errors] == [1]
+
+    tiles, _ = sheet.measure_tiles(cells, tile_height=sheet.PAGE_HEIGHT - sheet.MARGIN * 2)
+    assert [tile[0] for tile in tiles] == [0, 3]
+    with Image.open(path) as image:
+        assert image.size[1] == max(tile[3][1] for tile in tiles) + sheet.MARGIN * 2
+
+
+def test_sheet_pdf_splits_long_cells(tmp_path, formatter_available):
+    cells = [project.Cell("long", "python", "\n".join(f"x{i} = {i}" for i in range(300)))]
+    # Narrow, so each split of the cell gets a row (and a page) of its own
+    pages, errors = sheet.export_sheet(cells, str(tmp_path / "sheet.pdf"), width=100, page_height=1200)
+    assert errors == []
+    assert pages > 1
@@ -0,0 +1,221 @@
+import os
+import re
+import sys
+import time
+
+import project
+
+# Poll linked files this often, and wait until they have been quiet this long
+# before re-rendering, so a burst of saves renders once
+DEFAULT_INTERVAL = 0.5
+DEFAULT_DEBOUNCE = 0.3
+
+# Named regions are delimited by comment lines like "# region: setup" and
+# "# endregion" (also "// #region setup", "<!-- region: setup -->", ...)
+REGION_START = re.compile(r"#?region\b[:\s]\s*([\w.-]+)")
+REGION_END = re.compile(r"#?endregion\b")
+
+
+def source_path(project_dir, source):
+    """Absolute path of a cell's linked file; relative paths are relative to the project"""
+    return os.path.normpath(os.path.join(project_dir, source["path"]))
+
+
+def describe_source(source):
+    if source.get("region"):
+        return f"{source['path']}#{source['region']}"
+    if source.get("lines"):
+        return f"{source['path']}:{source['lines'][0]}-{source['lines'][1]}"
+    return source["path"]
+
+
+def extract_snippet(text, source):
+    """
+    The part of ``text`` a cell's ``source`` refers to: ``lines`` is a 1-based,
+    inclusive ``[first, last]`` range, ``region`` a named region (without its
+    marker lines), and neither means the whole file. Raises ValueError if the
+    range or region isn't in the file.
+    """
+    lines = text.splitlines()
+    region = source.get("region")
+    if region:
+        start = None
+        for number, line in enumerate(lines):
+            if start is None:
+                match = REGION_START.search(line)
+                if match and match.group(1) == region and not REGION_END.search(line):
+                    start = number + 1
+            elif REGION_END.search(line):
+                return "\n".join(lines[start:number])
+        if start is None:
+            raise ValueError(f"Region '{region}' not found in {source['path']}")
+        raise ValueError(f"Region '{region}' in {source['path']} has no end marker")
+
+    if source.get("lines"):
+        first, last = source["lines"]
+        if not 1 <= first <= last or first > len(lines):
+            raise ValueError(f"Lines {first}-{last} are not in {source['path']} ({len(lines)} lines)")
+        return "\n".join(lines[first - 1:last])
+    return "\n".join(lines)
+
+
+def sync_cells(project_dir, cells, indexes=None):
+    """
+    Refresh the code of linked cells (all, or just ``indexes``) from their
+    files. Returns ``(changed indexes, {index: error})``; cells whose file
+    can't be read keep their last code.
+    """
+    texts = {}
+    changed = []
+    errors = {}
+    for index in range(len(cells)) if indexes is None else indexes:
+        source = cells[index].source
+        if not source:
+            continue
+        path = source_path(project_dir, source)
+        try:
+            if path not in texts:
+                with open(path, "r", encoding="utf-8") as f:
+                    texts[path] = f.read()
+            code = extract_snippet(texts[path], source)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            errors[index] = str(e)
+            continue
+        if code != cells[index].code:
+            cells[index].code = code
+            changed.append(index)
+    return changed, errors
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ProjectWatcher:
+    """
+    Keeps the images of a project's linked cells up to date.
+
+    Polls the mtimes of file.imgnb and every linked file. When some change,
+    it waits for them to settle for ``debounce`` seconds, refreshes the code
+    of just the cells linked to those files and exports those cells. The render
+    cache skips cells whose snippet didn't change (e.g. a save that only
+    touched other parts of the file), and images whose encoded bytes are
+    unchanged are not rewritten.
+    """
+
+    def __init__(self, project_dir, output_dir=None, include_circles=False, workers=None,
+                 interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE, log=print):
+        self.project_dir = project_dir
+        self.output_dir = output_dir or project.images_folder(project_dir)
+        self.include_circles = include_circles
+        self.workers = workers
+        self.interval = interval
+        self.debounce = debounce
+        self.log = log
+        self.cells = []
+        self.settings = {}
+        self.signatures = {}  # watched path -> (mtime, size)
+
+    def load(self):
+        self.cells, self.settings = project.load_project(self.project_dir)
+        self.signatures = {path: file_signature(path) for path in self.watched_paths()}
+
+    def watched_paths(self):
+        paths = {project.project_file(self.project_dir), project.journal_file(self.project_dir)}
+        for cell in self.cells:
+            if cell.source:
+                paths.add(source_path(self.project_dir, cell.source))
+        return paths
+
+    def changed_paths(self):
+        return {path for path in self.watched_paths() if file_signature(path) != self.signatures.get(path)}
+
+    def linked_cells(self, paths):
+        return [
+            index for index, cell in enumerate(self.cells)
+            if cell.source and source_path(self.project_dir, cell.source) in paths
+        ]
+
+    def render(self, indexes):
+        """Refresh and export the cells at ``indexes``; returns the number of image files written"""
+        import exporter
+        import render_cache
+
+        _, errors = sync_cells(self.project_dir, self.cells, indexes)
+        for index, error in errors.items():
+            self.log(f"Error reading cell {index} ({describe_source(self.cells[index].source)}): {error}")
+        indexes = [index for index in indexes if index not in errors]
+        if not indexes:
+            return 0
+
+        cache = render_cache.RenderCache(self.project_dir)
+        stats = {}
+        results = exporter.export_cells(
+            [self.cells[index] for index in indexes], self.output_dir, self.workers, self.include_circles,
+            cache, options={"output": self.settings}, stats=stats,
+        )
+        written = 0
+        for position, image_paths, error in results:
+            cell = self.cells[indexes[position]]
+            if error:
+                self.log(f"Error exporting cell {indexes[position]} ({cell.title or 'untitled'}): {error}")
+                continue
+            # Cached cells and re-renders with identical bytes leave the files alone
+            pages = stats[position]["pages"]
+            changed = [page["path"] for page in pages if page.get("written") and not stats[position]["cached"]]
+            if changed:
+                written += len(changed)
+                self.log(f"Rendered: {', '.join(changed)}")
+        return written
+
+    def check(self):
+        """Handle any changes since the last check; returns True if something was re-rendered"""
+        changed = self.changed_paths()
+        if not changed:
+            return False
+
+        # Debounce: wait until the files stop changing
+        settled = dict((path, file_signature(path)) for path in changed)
+        while True:
+            time.sleep(self.debounce)
+            current = dict((path, file_signature(path)) for path in self.changed_paths())
+            if current == settled:
+                break
+            settled = current
+        changed |= set(settled)
+
+        project_files = {project.project_file(self.project_dir), project.journal_file(self.project_dir)}
+        if changed & project_files:
+            # Cells were added, removed or relinked: reload and check them all
+            self.load()
+            self.render(list(range(len(self.cells))))
+        else:
+            indexes = self.linked_cells(changed)
+            self.signatures.update((path, file_signature(path)) for path in changed)
+            self.render(indexes)
+        return True
+
+    def run(self):
+        self.load()
+        linked = sum(1 for cell in self.cells if cell.source)
+        self.render(list(range(len(self.cells))))
+        self.log(f"Watching {linked} linked cells in {self.project_dir} (Ctrl+C to stop)")
+        try:
+            while True:
+                if not self.check():
+                    time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+
+
+def watch(project_dir, output_dir=None, include_circles=False, workers=None,
+          interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+    watcher = ProjectWatcher(
+        project_dir, output_dir, include_circles, workers, interval, debounce,
+        log=lambda message: print(message, file=sys.stderr if message.startswith("Error") else sys.stdout),
+    )
+    watcher.run()